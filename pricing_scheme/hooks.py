@@ -122,13 +122,80 @@ app_license = "agpl-3.0"
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+	"Pricing Rule": {
+		"on_update": [
+			"pricing_scheme.utils.rule_index.clear_rule_index",
+			"pricing_scheme.utils.pricing_rule.clear_pricing_rule_details",
+			"pricing_scheme.utils.bulk.enqueue_scheme_reapplication",
+		],
+		"after_rename": [
+			"pricing_scheme.utils.rule_index.clear_rule_index",
+			"pricing_scheme.utils.pricing_rule.clear_pricing_rule_details",
+		],
+		"on_trash": [
+			"pricing_scheme.utils.rule_index.clear_rule_index",
+			"pricing_scheme.utils.pricing_rule.clear_pricing_rule_details",
+		],
+	},
+	"Item Attribute": {
+		"on_update": "pricing_scheme.utils.variant.clear_door_attributes",
+		"after_rename": "pricing_scheme.utils.variant.clear_door_attributes",
+		"on_trash": "pricing_scheme.utils.variant.clear_door_attributes",
+	},
+	"Item Group": {
+		"on_update": "pricing_scheme.utils.nested_set.clear_tree_cache",
+		"after_rename": "pricing_scheme.utils.nested_set.clear_tree_cache",
+		"on_trash": "pricing_scheme.utils.nested_set.clear_tree_cache",
+	},
+	"Customer Group": {
+		"on_update": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+		"after_rename": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+		"on_trash": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+	},
+	"Territory": {
+		"on_update": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+		"after_rename": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+		"on_trash": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+	},
+	"Supplier Group": {
+		"on_update": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+		"after_rename": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+		"on_trash": [
+			"pricing_scheme.utils.nested_set.clear_tree_cache",
+			"pricing_scheme.utils.rule_index.clear_transaction_rules",
+		],
+	},
+	"Warehouse": {
+		"on_update": "pricing_scheme.utils.nested_set.clear_tree_cache",
+		"after_rename": "pricing_scheme.utils.nested_set.clear_tree_cache",
+		"on_trash": "pricing_scheme.utils.nested_set.clear_tree_cache",
+	},
+}
 
 # Scheduled Tasks
 # ---------------
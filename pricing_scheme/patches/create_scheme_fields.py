@@ -99,6 +99,7 @@ def execute():
                     "options": "Pricing Rule",
                     "insert_after": "pricing_rules",
                     "read_only": 1,
+                    "search_index": 1,
                 },
                 {
                     "fieldname": "skip_auto_apply_scheme",
@@ -108,6 +109,33 @@ def execute():
                     "read_only": 1,
                 },
             ],
+            "Quotation Item": [
+                {
+                    "fieldname": "pricing_scheme",
+                    "label": "Pricing Scheme",
+                    "fieldtype": "Link",
+                    "options": "Pricing Rule",
+                    "insert_after": "pricing_rules",
+                    "read_only": 1,
+                },
+                {
+                    "fieldname": "skip_auto_apply_scheme",
+                    "label": "Skip Primary Scheme",
+                    "fieldtype": "Check",
+                    "insert_after": "pricing_scheme",
+                    "read_only": 1,
+                },
+            ],
+            "Quotation": [
+                {
+                    "fieldname": "pricing_scheme",
+                    "label": "Pricing Scheme",
+                    "fieldtype": "Link",
+                    "options": "Pricing Rule",
+                    "insert_after": "apply_discount_on",
+                    "read_only": 1,
+                },
+            ],
             "Sales Invoice Item": [
                 {
                     "fieldname": "pricing_scheme",
@@ -137,6 +165,15 @@ def execute():
                     "insert_after": "apply_discount_on",
                     "read_only": 1,
                 },
+                {
+                    "fieldname": "pricing_fingerprint",
+                    "label": "Pricing Fingerprint",
+                    "fieldtype": "Data",
+                    "insert_after": "pricing_scheme",
+                    "read_only": 1,
+                    "hidden": 1,
+                    "no_copy": 1,
+                },
             ],
         }
     )
@@ -1,9 +1,13 @@
 # Copyright (c) 2024, Wahni IT Solutions Pvt Ltd and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
 class PricingRuleRate(Document):
 	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Pricing Rule Rate", ["parent", "item_code"])
@@ -23,6 +23,7 @@ pricing_scheme.PricingScheme = class PricingScheme {
         this.ignore_rule_fetch = false;
         this.rejection_callback = null;
         this.form_requires_save = false;
+        this.scheme_details = {};
     }
 
     init() {
@@ -555,8 +556,9 @@ pricing_scheme.PricingScheme = class PricingScheme {
 
         $wrapper.css("margin-bottom", 0).addClass("text-center").html(rule_html);
 
-        $wrapper.on("click", "button", function () {
+        $wrapper.on("click", "button", async function () {
             let $btn = $(this);
+            await me.load_scheme_details($btn.data("name"));
             d.set_value("pricing_rule", $btn.data("name"));
             d.set_value("selected_scheme", me.schemes.rules[$btn.data("name")].title);
             if (me.schemes.rules[$btn.data("name")].apply_on != "Transaction") {
@@ -602,6 +604,24 @@ pricing_scheme.PricingScheme = class PricingScheme {
         });
     }
 
+    async load_scheme_details(name) {
+        // Free items and rate and discount tables are fetched for the selected scheme only
+        let me = this;
+        let items = me.frm.doc.items
+            .filter((item) => item.item_code)
+            .map((item) => ({ item_code: item.item_code, item_group: item.item_group }));
+        let key = JSON.stringify([name, items]);
+        if (!me.scheme_details[key]) {
+            let r = await frappe.call({
+                method: "pricing_scheme.utils.pricing_scheme.get_scheme_details",
+                args: { rule: name, items: items },
+            });
+            if (r.exc || !r.message) return;
+            me.scheme_details[key] = r.message;
+        }
+        Object.assign(me.schemes.rules[name], me.scheme_details[key]);
+    }
+
     async get_pricing_scheme() {
         let me = this;
         if (me.ignore_rule_fetch) {
@@ -610,17 +630,121 @@ pricing_scheme.PricingScheme = class PricingScheme {
         }
         me.schemes = {};
         me.applied_schemes = {};
-        await frappe.call({
+        let response = await me.fetch_pricing_rules();
+        if (response && response.incremental && response.incremental.resync) {
+            me.frm.__pricing_scheme_evaluation = null;
+            response = await me.fetch_pricing_rules();
+        }
+        if (response) {
+            me.schemes = response;
+            me.applied_schemes = response.applied_schemes;
+        }
+    }
+
+    async fetch_pricing_rules() {
+        let me = this;
+        let request = me.get_incremental_request();
+        let r = await frappe.call({
             method: "pricing_scheme.utils.pricing_scheme.get_pricing_rules",
-            args: {
-                doc: me.frm.doc,
-            },
-            callback: function (r) {
-                if (!r.exc && r.message) {
-                    me.schemes = r.message;
-                    me.applied_schemes = r.message.applied_schemes;
+            args: request.args,
+        });
+        if (r.exc || !r.message) return null;
+        if (r.message.incremental && !r.message.incremental.resync) {
+            me.update_evaluation_state(r.message.incremental, request.signatures);
+        }
+        return me.expand_response(r.message);
+    }
+
+    expand_response(response) {
+        // Restores the v2 compact response to the shape the dialog reads
+        if (response.format !== 2) return response;
+
+        const tables = {
+            free_items: [],
+            item_wise_rates: {},
+            item_group_wise_discounts: {},
+            item_wise_discounts: {},
+        };
+        Object.keys(response.rules).forEach((name) => {
+            let rule = response.rules[name];
+            Object.keys(tables).forEach((key) => {
+                rule[key] = key in rule ? response.tables[rule[key]] : tables[key];
+            });
+            rule = Object.assign(
+                { pricing_rule: name, applicable_items: [] },
+                response.defaults,
+                rule
+            );
+            // Fields left out for holding None
+            (response.rule_fields || []).forEach((field) => {
+                if (!(field in rule)) rule[field] = null;
+            });
+            response.rules[name] = rule;
+        });
+
+        let items = {};
+        Object.keys(response.items).forEach((name) => {
+            items[name] = {};
+            response.item_fields.forEach((field, idx) => {
+                items[name][field] = response.items[name][idx];
+            });
+        });
+        response.items = items;
+        return response;
+    }
+
+    get_incremental_request() {
+        // Rows unchanged since the last evaluation are sent by name and fingerprint only
+        let me = this;
+        let state = me.frm.__pricing_scheme_evaluation;
+        if (state && state.name !== me.frm.doc.name) state = null;
+
+        let items = [];
+        let signatures = {};
+        let rows = me.frm.doc.items.map((item) => {
+            if (state) {
+                signatures[item.name] = me.get_row_signature(item, state.fields);
+                let cached = state.rows[item.name];
+                if (cached && cached.signature === signatures[item.name]) {
+                    return [item.name, cached.fingerprint];
                 }
+            }
+            items.push(item);
+            return [item.name, null];
+        });
+
+        return {
+            args: {
+                doc: Object.assign({}, me.frm.doc, { items: items }),
+                incremental: { token: state ? state.token : null, rows: rows },
+                response_format: 2,
+                summary: 1,
             },
+            signatures: signatures,
+        };
+    }
+
+    update_evaluation_state(incremental, signatures) {
+        let me = this;
+        let rows = {};
+        me.frm.doc.items.forEach((item) => {
+            if (!incremental.rows[item.name]) return;
+            rows[item.name] = {
+                fingerprint: incremental.rows[item.name],
+                signature:
+                    signatures[item.name] ||
+                    me.get_row_signature(item, incremental.fields),
+            };
         });
+        me.frm.__pricing_scheme_evaluation = {
+            name: me.frm.doc.name,
+            token: incremental.token,
+            fields: incremental.fields,
+            rows: rows,
+        };
+    }
+
+    get_row_signature(item, fields) {
+        return JSON.stringify(fields.map((field) => item[field] ?? null));
     }
 };
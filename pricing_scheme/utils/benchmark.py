@@ -0,0 +1,363 @@
+# Copyright (c) 2024, Wahni IT Solutions Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+"""Benchmarks for the scheme engine against synthetic rules and orders.
+
+Meant for a local test site only, e.g.
+
+    bench --site test.local execute pricing_scheme.utils.benchmark.run \
+        --kwargs "{'lines': [10, 100, 1000], 'iterations': 5}"
+
+`setup` creates the items, groups, brands and Pricing Rules, `run` builds
+in-memory Sales Orders and measures each stage, and `cleanup` deletes the
+generated Pricing Rules.
+"""
+
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import add_days, cint, flt, nowdate
+
+from pricing_scheme.utils.pricing_rule import RULE_DETAILS_KEY
+from pricing_scheme.utils.pricing_scheme import (
+    auto_apply_primary_scheme,
+    get_pricing_rules,
+    validate_applied_scheme,
+)
+from pricing_scheme.utils.rule_index import clear_rule_index
+
+BENCHMARK_PREFIX = "Benchmark Scheme"
+BENCHMARK_ITEM = "BENCH-ITEM-{}"
+BENCHMARK_GROUP = "Benchmark Group {}"
+BENCHMARK_BRAND = "Benchmark Brand {}"
+BENCHMARK_CUSTOMER = "Benchmark Customer"
+
+apply_on_tables = {"Item Code": "items", "Item Group": "item_groups", "Brand": "brands"}
+
+stages = {
+    "apply_pricing_rule": lambda doc: get_pricing_rules(doc),
+    "auto_apply_primary_scheme": lambda doc: auto_apply_primary_scheme(doc),
+    "validate_applied_scheme": lambda doc: validate_applied_scheme(doc),
+}
+
+
+def setup(
+    item_code_rules=100,
+    item_group_rules=20,
+    brand_rules=10,
+    items=200,
+    item_groups=10,
+    brands=5,
+    item_wise_rates=10,
+    group_discounts=5,
+    mixed_conditions=0.2,
+    conditions=0.2,
+    auto_apply=0.1,
+    seed=1,
+):
+    """Create the synthetic masters and Pricing Rules."""
+    rand = random.Random(seed)
+    company = get_company()
+    groups = [make_item_group(BENCHMARK_GROUP.format(i)) for i in range(item_groups)]
+    brand_names = [make_brand(BENCHMARK_BRAND.format(i)) for i in range(brands)]
+    item_codes = [
+        make_item(
+            BENCHMARK_ITEM.format(i), rand.choice(groups), rand.choice(brand_names)
+        )
+        for i in range(items)
+    ]
+    make_customer()
+
+    cleanup()
+    for apply_on, count, values in (
+        ("Item Code", item_code_rules, item_codes),
+        ("Item Group", item_group_rules, groups),
+        ("Brand", brand_rules, brand_names),
+    ):
+        for i in range(count):
+            rule = make_rule(
+                rand, company, apply_on, i, values, mixed_conditions, conditions
+            )
+            rule.auto_apply_scheme = int(rand.random() < auto_apply)
+            if apply_on == "Item Code" and item_wise_rates:
+                rule.rate_or_discount = "Rate"
+                rule.has_item_wise_rates = 1
+                sample_size = min(item_wise_rates, len(item_codes))
+                for item_code in rand.sample(item_codes, sample_size):
+                    rule.append(
+                        "item_wise_rates",
+                        {"item_code": item_code, "rate": rand.randint(50, 500)},
+                    )
+            elif apply_on == "Item Group" and group_discounts:
+                rule.has_item_group_wise_discounts = 1
+                sample_size = min(group_discounts, len(groups))
+                for item_group in rand.sample(groups, sample_size):
+                    rule.append(
+                        "item_group_wise_discounts",
+                        {
+                            "item_group": item_group,
+                            "discount_percentage": rand.randint(1, 30),
+                        },
+                    )
+            rule.insert(ignore_permissions=True)
+
+    frappe.db.commit()
+    clear_rule_index()
+
+
+def cleanup():
+    """Delete the Pricing Rules created by `setup`."""
+    for name in frappe.get_all(
+        "Pricing Rule",
+        filters={"title": ["like", BENCHMARK_PREFIX + "%"]},
+        pluck="name",
+    ):
+        frappe.delete_doc("Pricing Rule", name, ignore_permissions=True, force=True)
+
+    frappe.db.commit()
+    clear_rule_index()
+
+
+def run(lines=(10, 100, 1000), iterations=5, cold=0, seed=1, setup_rules=0):
+    """Return latency percentiles, query counts and peak memory per order size and stage."""
+    if setup_rules:
+        setup(seed=seed)
+
+    rand = random.Random(seed)
+    item_codes = frappe.get_all(
+        "Item", filters={"name": ["like", BENCHMARK_ITEM.format("%")]}, pluck="name"
+    )
+    if not item_codes:
+        frappe.throw("Run pricing_scheme.utils.benchmark.setup first.")
+
+    items = {
+        d.name: d
+        for d in frappe.get_all(
+            "Item",
+            filters={"name": ["in", item_codes]},
+            fields=["name", "item_group", "brand", "weight_per_unit"],
+        )
+    }
+
+    iterations = cint(iterations)
+    results = {}
+    for size in [cint(d) for d in lines]:
+        samples = {stage: {"ms": [], "queries": [], "peak_kib": []} for stage in stages}
+        for run_no in range(iterations + 2):
+            trace_memory = run_no == iterations + 1
+            doc = make_order(rand, items, size)
+            for stage, method in stages.items():
+                if cint(cold):
+                    clear_caches()
+
+                with measure(trace_memory) as measurement:
+                    try:
+                        method(doc)
+                    except frappe.ValidationError:
+                        frappe.clear_messages()
+
+                if trace_memory:
+                    samples[stage]["peak_kib"].append(measurement["peak_kib"])
+                elif run_no:
+                    samples[stage]["ms"].append(measurement["ms"])
+                    samples[stage]["queries"].append(measurement["queries"])
+
+        results[size] = {stage: summarize(samples[stage]) for stage in stages}
+
+    return results
+
+
+@contextmanager
+def measure(trace_memory=False):
+    """Record wall time, SQL query count and optionally peak memory of the block."""
+    measurement = {}
+    queries = [0]
+    sql = frappe.db.sql
+
+    def counting_sql(*args, **kwargs):
+        queries[0] += 1
+        return sql(*args, **kwargs)
+
+    frappe.db.sql = counting_sql
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement["ms"] = (time.perf_counter() - start) * 1000
+        measurement["queries"] = queries[0]
+        if trace_memory:
+            measurement["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+
+        frappe.db.sql = sql
+
+
+def summarize(samples):
+    ms = sorted(samples["ms"])
+    queries = samples["queries"] or [0]
+    return {
+        "p50_ms": percentile(ms, 50),
+        "p90_ms": percentile(ms, 90),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": percentile(ms, 100),
+        "queries": flt(sum(queries) / len(queries), 1),
+        "peak_kib": flt(max(samples["peak_kib"] or [0]), 1),
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+
+    return flt(values[min(len(values) - 1, int(len(values) * pct / 100))], 2)
+
+
+def clear_caches():
+    clear_rule_index()
+    frappe.cache.delete_value(RULE_DETAILS_KEY)
+    frappe.local.pricing_rule_details = {}
+
+
+def make_order(rand, items, size):
+    """Return an unsaved Sales Order of `size` lines with pricing fields filled in."""
+    customer = frappe.get_cached_doc("Customer", BENCHMARK_CUSTOMER)
+    company = get_company()
+    doc = frappe.get_doc(
+        {
+            "doctype": "Sales Order",
+            "customer": customer.name,
+            "customer_group": customer.customer_group,
+            "territory": customer.territory,
+            "company": company,
+            "currency": frappe.get_cached_value("Company", company, "default_currency"),
+            "conversion_rate": 1,
+            "selling_price_list": "Standard Selling",
+            "plc_conversion_rate": 1,
+            "transaction_date": nowdate(),
+            "delivery_date": add_days(nowdate(), 7),
+            "items": [],
+        }
+    )
+    doc.price_list_currency = doc.currency
+    for i in range(size):
+        item = items[rand.choice(list(items))]
+        qty = rand.randint(1, 50)
+        rate = rand.randint(50, 500)
+        doc.append(
+            "items",
+            {
+                "name": f"bench-row-{i}",
+                "item_code": item.name,
+                "item_group": item.item_group,
+                "brand": item.brand,
+                "uom": "Nos",
+                "stock_uom": "Nos",
+                "conversion_factor": 1,
+                "qty": qty,
+                "stock_qty": qty,
+                "weight_per_unit": item.weight_per_unit,
+                "total_weight": flt(item.weight_per_unit) * qty,
+                "price_list_rate": rate,
+                "rate": rate,
+                "amount": rate * qty,
+                "net_amount": rate * qty,
+            },
+        )
+
+    doc.total_qty = sum(d.qty for d in doc.items)
+    doc.total_net_weight = sum(flt(d.total_weight) for d in doc.items)
+    doc.net_total = sum(d.net_amount for d in doc.items)
+    return doc
+
+
+def make_rule(rand, company, apply_on, i, values, mixed_conditions, conditions):
+    field = frappe.scrub(apply_on)
+    rule = frappe.get_doc(
+        {
+            "doctype": "Pricing Rule",
+            "title": f"{BENCHMARK_PREFIX} {apply_on} {i}",
+            "apply_on": apply_on,
+            "price_or_product_discount": "Price",
+            "rate_or_discount": "Discount Percentage",
+            "discount_percentage": rand.randint(1, 20),
+            "rate_based_on": "Qty",
+            "qty_based_on": "Stock",
+            "selling": 1,
+            "company": company,
+            "min_qty": rand.choice([0, 0, 5, 10]),
+            "priority": str(rand.randint(1, 20)),
+            "mixed_conditions": int(
+                apply_on != "Item Code" and rand.random() < mixed_conditions
+            ),
+            "condition": "total_qty >= 0" if rand.random() < conditions else None,
+        }
+    )
+    for value in rand.sample(values, min(len(values), rand.randint(1, 5))):
+        rule.append(apply_on_tables[apply_on], {field: value})
+
+    return rule
+
+
+def make_item_group(name):
+    if not frappe.db.exists("Item Group", name):
+        frappe.get_doc(
+            {
+                "doctype": "Item Group",
+                "item_group_name": name,
+                "parent_item_group": "All Item Groups",
+            }
+        ).insert(ignore_permissions=True)
+
+    return name
+
+
+def make_brand(name):
+    if not frappe.db.exists("Brand", name):
+        frappe.get_doc({"doctype": "Brand", "brand": name}).insert(ignore_permissions=True)
+
+    return name
+
+
+def make_item(item_code, item_group, brand):
+    if not frappe.db.exists("Item", item_code):
+        frappe.get_doc(
+            {
+                "doctype": "Item",
+                "item_code": item_code,
+                "item_group": item_group,
+                "brand": brand,
+                "stock_uom": "Nos",
+                "is_stock_item": 0,
+                "weight_per_unit": 1,
+            }
+        ).insert(ignore_permissions=True)
+
+    return item_code
+
+
+def make_customer():
+    if not frappe.db.exists("Customer", BENCHMARK_CUSTOMER):
+        frappe.get_doc(
+            {
+                "doctype": "Customer",
+                "customer_name": BENCHMARK_CUSTOMER,
+                "customer_group": frappe.db.get_single_value(
+                    "Selling Settings", "customer_group"
+                )
+                or "All Customer Groups",
+                "territory": frappe.db.get_single_value("Selling Settings", "territory")
+                or "All Territories",
+            }
+        ).insert(ignore_permissions=True)
+
+
+def get_company():
+    return frappe.defaults.get_user_default("Company") or frappe.get_all(
+        "Company", pluck="name", limit=1
+    )[0]
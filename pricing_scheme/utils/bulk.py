@@ -0,0 +1,283 @@
+# Copyright (c) 2024, Wahni IT Solutions Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from pricing_scheme.utils.pricing_rule import (
+    add_item_group_discount,
+    add_item_wise_values,
+    get_pricing_rule_details,
+)
+from pricing_scheme.utils.pricing_scheme import (
+    apply_scheme_rate,
+    auto_apply_primary_scheme,
+    get_pricing_rules,
+)
+from pricing_scheme.utils.rule_index import get_rule_index, get_rule_records
+
+BULK_JOB_KEY = "pricing_scheme:bulk:{}"
+BULK_JOB_TTL = 24 * 60 * 60
+BULK_CHUNK_SIZE = 50
+
+# Draft orders re-priced per job, per transaction, and the pause in seconds
+# between transactions when a scheme changes
+REAPPLY_CHUNK_SIZE = 200
+REAPPLY_BATCH_SIZE = 20
+REAPPLY_THROTTLE = 1
+
+bulk_doctypes = ("Sales Order", "Quotation")
+
+# Pricing Rule fields and child tables that change the rate a scheme gives
+reapply_fields = (
+    "rate",
+    "discount_percentage",
+    "discount_amount",
+    "rate_or_discount",
+    "rate_based_on",
+    "min_qty",
+    "max_qty",
+    "min_amt",
+    "max_amt",
+    "qty_based_on",
+    "has_item_wise_rates",
+    "has_item_wise_discounts",
+    "has_item_group_wise_discounts",
+)
+reapply_tables = {
+    "item_wise_rates": ("item_code", "rate"),
+    "item_wise_discounts": ("item_code", "discount_percentage"),
+    "item_group_wise_discounts": ("item_group", "discount_percentage"),
+}
+
+
+@frappe.whitelist()
+def evaluate_pricing_schemes(
+    doctype,
+    names=None,
+    filters=None,
+    apply=0,
+    chunk_size=BULK_CHUNK_SIZE,
+    with_results=0,
+):
+    """Evaluate or auto apply schemes on many documents in background jobs."""
+    if doctype not in bulk_doctypes:
+        frappe.throw(_("Schemes cannot be evaluated in bulk for {0}.").format(doctype))
+
+    apply, with_results = cint(apply), cint(with_results)
+    frappe.has_permission(doctype, "write" if apply else "read", throw=True)
+
+    if names:
+        names = list(dict.fromkeys(frappe.parse_json(names)))
+    else:
+        filters = frappe.parse_json(filters) or {}
+        if apply and isinstance(filters, dict):
+            filters["docstatus"] = 0
+        elif apply:
+            filters.append([doctype, "docstatus", "=", 0])
+
+        names = frappe.get_list(
+            doctype, filters=filters, pluck="name", limit_page_length=0
+        )
+
+    chunk_size = cint(chunk_size) or BULK_CHUNK_SIZE
+    chunks = [names[i : i + chunk_size] for i in range(0, len(names), chunk_size)]
+    job_id = frappe.generate_hash(length=10)
+    frappe.cache.set_value(
+        BULK_JOB_KEY.format(job_id),
+        {
+            "doctype": doctype,
+            "apply": apply,
+            "with_results": with_results,
+            "total": len(names),
+            "chunks": len(chunks),
+            "owner": frappe.session.user,
+        },
+        expires_in_sec=BULK_JOB_TTL,
+    )
+
+    # Build the shared rule index once before the workers start
+    get_rule_index()
+
+    for chunk, chunk_names in enumerate(chunks):
+        frappe.enqueue(
+            "pricing_scheme.utils.bulk.evaluate_chunk",
+            queue="long",
+            job=job_id,
+            chunk=chunk,
+            doctype=doctype,
+            names=chunk_names,
+            apply=apply,
+            with_results=with_results,
+        )
+
+    return {"job_id": job_id, "total": len(names), "chunks": len(chunks)}
+
+
+def evaluate_chunk(job, chunk, doctype, names, apply=0, with_results=0):
+    """Evaluate one chunk of a bulk job, recording the status of each document."""
+    results_key = get_chunk_key(job, chunk)
+    results = {}
+    for name in names:
+        try:
+            frappe.db.savepoint("pricing_scheme_bulk")
+            doc = frappe.get_doc(doctype, name)
+            if apply:
+                if doc.docstatus != 0:
+                    frappe.throw(_("{0} {1} is not a draft.").format(doctype, name))
+
+                auto_apply_primary_scheme(doc)
+                doc.save()
+                frappe.db.commit()
+                results[name] = {"status": "Success"}
+            else:
+                doc.check_permission("read")
+                result = get_pricing_rules(doc)
+                if with_results:
+                    frappe.cache.set_value(
+                        get_result_key(job, name), result, expires_in_sec=BULK_JOB_TTL
+                    )
+                results[name] = {"status": "Success"}
+        except Exception as e:
+            frappe.db.rollback(save_point="pricing_scheme_bulk")
+            frappe.log_error(
+                title=_("Bulk scheme evaluation failed"),
+                reference_doctype=doctype,
+                reference_name=name,
+            )
+            results[name] = {"status": "Failed", "error": str(e)}
+
+        frappe.cache.set_value(results_key, results, expires_in_sec=BULK_JOB_TTL)
+
+
+@frappe.whitelist()
+def get_bulk_evaluation_status(job_id, with_results=0):
+    """Return the progress of a bulk job and, with `with_results`, its per document results."""
+    job = frappe.cache.get_value(BULK_JOB_KEY.format(job_id))
+    if not job or job["owner"] != frappe.session.user:
+        frappe.throw(_("Bulk scheme evaluation {0} not found.").format(job_id))
+
+    results = {}
+    for chunk in range(job["chunks"]):
+        results.update(frappe.cache.get_value(get_chunk_key(job_id, chunk)) or {})
+
+    out = {
+        "doctype": job["doctype"],
+        "total": job["total"],
+        "processed": len(results),
+        "failed": [
+            name for name, result in results.items() if result["status"] == "Failed"
+        ],
+    }
+    if cint(with_results):
+        if job.get("with_results"):
+            for name, result in results.items():
+                if result["status"] == "Success":
+                    result["result"] = frappe.cache.get_value(
+                        get_result_key(job_id, name)
+                    )
+
+        out["results"] = results
+
+    return out
+
+
+def get_chunk_key(job, chunk):
+    return f"{BULK_JOB_KEY.format(job)}:{chunk}"
+
+
+def get_result_key(job, name):
+    return f"{BULK_JOB_KEY.format(job)}:result:{name}"
+
+
+def enqueue_scheme_reapplication(doc, method=None, *args):
+    """Queue re-pricing of draft Sales Orders when a Price scheme's rates or slabs change."""
+    if (
+        not doc.get_doc_before_save()
+        or doc.disable
+        or doc.price_or_product_discount != "Price"
+        or not has_rate_changed(doc)
+    ):
+        return
+
+    names = frappe.get_all(
+        "Sales Order Item",
+        filters={
+            "parenttype": "Sales Order",
+            "pricing_scheme": doc.name,
+            "docstatus": 0,
+        },
+        pluck="parent",
+        distinct=True,
+    )
+    for i in range(0, len(names), REAPPLY_CHUNK_SIZE):
+        frappe.enqueue(
+            "pricing_scheme.utils.bulk.reapply_scheme",
+            queue="long",
+            enqueue_after_commit=True,
+            scheme=doc.name,
+            names=names[i : i + REAPPLY_CHUNK_SIZE],
+        )
+
+
+def has_rate_changed(doc):
+    doc_before_save = doc.get_doc_before_save()
+    if any(doc.has_value_changed(field) for field in reapply_fields):
+        return True
+
+    for table, fields in reapply_tables.items():
+        if get_table_values(doc, table, fields) != get_table_values(
+            doc_before_save, table, fields
+        ):
+            return True
+
+    return False
+
+
+def get_table_values(doc, table, fields):
+    return sorted(
+        tuple(row.get(field) for field in fields) for row in doc.get(table) or []
+    )
+
+
+def reapply_scheme(scheme, names):
+    """Recompute the `scheme` rows of draft Sales Orders in throttled batches."""
+    rules = get_rule_records({"name": scheme, "disable": 0})
+    if not rules:
+        return
+
+    rule = rules[0]
+    for i in range(0, len(names), REAPPLY_BATCH_SIZE):
+        for name in names[i : i + REAPPLY_BATCH_SIZE]:
+            try:
+                frappe.db.savepoint("pricing_scheme_reapply")
+                doc = frappe.get_doc("Sales Order", name)
+                if doc.docstatus != 0:
+                    continue
+
+                rows = [
+                    row
+                    for row in doc.items
+                    if row.pricing_scheme == scheme and not row.is_free_item
+                ]
+                details = get_pricing_rule_details(frappe._dict(), rule)
+                add_item_wise_values({scheme: details}, [row.item_code for row in rows])
+                for row in rows:
+                    add_item_group_discount(details, row.item_group)
+                    apply_scheme_rate(row, details)
+
+                doc.flags.reapply_scheme = scheme
+                doc.save()
+            except Exception:
+                frappe.db.rollback(save_point="pricing_scheme_reapply")
+                frappe.log_error(
+                    title=_("Scheme {0} could not be re-applied").format(scheme),
+                    reference_doctype="Sales Order",
+                    reference_name=name,
+                )
+
+        frappe.db.commit()
+        time.sleep(REAPPLY_THROTTLE)
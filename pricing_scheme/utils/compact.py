@@ -0,0 +1,80 @@
+# Copyright (c) 2024, Wahni IT Solutions Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import json
+
+RESPONSE_FORMAT = 2
+
+# Rule detail tables sent once per distinct content and referenced by id
+rule_tables = (
+    "free_items",
+    "item_wise_rates",
+    "item_group_wise_discounts",
+    "item_wise_discounts",
+)
+
+# Rule fields omitted when they hold these values; other fields are
+# omitted when None and rule tables when empty
+rule_defaults = {
+    "qty_based_on": "Stock",
+    "free_qty_type": "Qty",
+    "rate_based_on": "Weight",
+    "price_or_product_discount": "Price",
+    "rate_or_discount": "Discount Percentage",
+}
+
+item_fields = ["item_code", "qty", "stock_qty", "weight", "amount"]
+
+
+def compact_response(out):
+    """Return the v2 form of a `get_pricing_rules` response, expanded back by `pricing_scheme.js`."""
+    item_codes = {item.get("item_code") for item in out["items"].values()}
+    tables, table_ids = {}, {}
+    rules = {}
+    rule_fields = {}
+    for name, rule in out["rules"].items():
+        compact = {}
+        for key, value in rule.items():
+            if key == "pricing_rule":
+                continue
+
+            rule_fields[key] = None
+
+            if key in rule_defaults:
+                if value != rule_defaults[key]:
+                    compact[key] = value
+                continue
+
+            if key in ("item_wise_rates", "item_wise_discounts") and value:
+                value = {code: d for code, d in value.items() if code in item_codes}
+
+            if value is None:
+                continue
+
+            if key in rule_tables:
+                if not value:
+                    continue
+
+                table_key = json.dumps(value, sort_keys=True, default=str)
+                if table_key not in table_ids:
+                    table_ids[table_key] = str(len(tables))
+                    tables[table_ids[table_key]] = value
+                value = table_ids[table_key]
+
+            compact[key] = value
+
+        rules[name] = compact
+
+    return {
+        **out,
+        "format": RESPONSE_FORMAT,
+        "defaults": rule_defaults,
+        "tables": tables,
+        "rule_fields": list(rule_fields),
+        "item_fields": item_fields,
+        "rules": rules,
+        "items": {
+            name: [item.get(field) for field in item_fields]
+            for name, item in out["items"].items()
+        },
+    }
@@ -0,0 +1,155 @@
+# Copyright (c) 2024, Wahni IT Solutions Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import hashlib
+import json
+
+import frappe
+
+from pricing_scheme.utils.pricing_rule import (
+    evaluate_item,
+    finish_evaluation,
+    start_evaluation,
+)
+from pricing_scheme.utils.pricing_scheme import get_pricing_args
+from pricing_scheme.utils.rule_index import get_candidate_rules, get_rule_index
+
+EVALUATION_CACHE_TTL = 30 * 60
+
+# Row fields an evaluation depends on; the client re-sends a row when any of them changes
+ROW_FINGERPRINT_FIELDS = [
+    "item_code",
+    "item_name",
+    "item_group",
+    "brand",
+    "uom",
+    "warehouse",
+    "qty",
+    "stock_qty",
+    "total_weight",
+    "amount",
+    "net_amount",
+    "price_list_rate",
+    "pricing_scheme",
+    "is_free_item",
+]
+
+
+def get_incremental_pricing_rules(doc, incremental, summary=False):
+    """Evaluate schemes re-using the cached evaluation of rows the client did not re-send."""
+    if isinstance(doc, str):
+        doc = json.loads(doc)
+
+    if isinstance(incremental, str):
+        incremental = json.loads(incremental)
+
+    incremental = frappe._dict(incremental)
+    cache_key = get_evaluation_cache_key(doc)
+    cached = frappe.cache.get_value(cache_key) or {}
+    if incremental.token and incremental.token != cached.get("token"):
+        return {"incremental": {"resync": 1}}
+
+    cached_rows = cached.get("rows", {}) if incremental.token else {}
+    sent_rows = {row.get("name"): row for row in doc.get("items") or []}
+    items = []
+    for name, fingerprint in incremental.rows or []:
+        if name in sent_rows:
+            items.append(sent_rows[name])
+        elif fingerprint and cached_rows.get(name, {}).get("fingerprint") == fingerprint:
+            items.append(cached_rows[name]["row"])
+        else:
+            return {"incremental": {"resync": 1}}
+
+    doc["items"] = items
+    doc = frappe.get_doc(doc)
+    with start_evaluation(get_pricing_args(doc, items), doc) as (context, item_list):
+        if not context:
+            return {"rules": {}, "items": {}, "applied_schemes": {}}
+
+        header = get_header_fingerprint(context.args)
+        rule_index = get_rule_index()
+        if header != cached.get("header"):
+            cached_rows = {}
+
+        rows = {}
+        evaluated_items = []
+        for item in item_list:
+            name = item.get("name")
+            evaluation = None
+            if name not in sent_rows:
+                evaluation = restore_evaluation(cached_rows.get(name), rule_index)
+
+            if not evaluation:
+                evaluation = evaluate_item(context, item)
+                evaluation.volatile = is_volatile(evaluation.args)
+
+            evaluated_items.append(evaluation)
+            rows[name] = {
+                "fingerprint": get_row_fingerprint(item),
+                "row": item,
+                "args": evaluation.args,
+                "data": evaluation.data,
+                "rules": list(evaluation.rules),
+                "volatile": evaluation.volatile,
+            }
+
+        out = finish_evaluation(context, evaluated_items, summary=summary)
+
+    token = frappe.generate_hash(length=10)
+    frappe.cache.set_value(
+        cache_key,
+        {"token": token, "header": header, "rows": rows},
+        expires_in_sec=EVALUATION_CACHE_TTL,
+    )
+    out["incremental"] = {
+        "token": token,
+        "fields": ROW_FINGERPRINT_FIELDS,
+        "rows": {name: row["fingerprint"] for name, row in rows.items()},
+    }
+
+    return out
+
+
+def restore_evaluation(cached_row, rule_index):
+    if not cached_row or cached_row["volatile"]:
+        return
+
+    if any(name not in rule_index.rules for name in cached_row["rules"]):
+        return
+
+    return frappe._dict(
+        item=cached_row["row"],
+        args=frappe._dict(cached_row["args"]),
+        data=cached_row["data"],
+        rules={name: rule_index.rules[name] for name in cached_row["rules"]},
+        volatile=False,
+    )
+
+
+def is_volatile(args):
+    """Return True if the row's result can change when other rows or header fields do."""
+    if not args.item_code or args.get("pricing_scheme") or args.get("is_free_item"):
+        return False
+
+    return any(rule.mixed_conditions or rule.condition for rule in get_candidate_rules(args))
+
+
+def get_evaluation_cache_key(doc):
+    return "pricing_scheme:evaluation:{}:{}:{}".format(
+        frappe.session.user, doc.get("doctype"), doc.get("name")
+    )
+
+
+def get_header_fingerprint(args):
+    return get_hash(
+        [get_rule_index().version]
+        + [[key, value] for key, value in sorted(args.items()) if key != "items"]
+    )
+
+
+def get_row_fingerprint(row):
+    return get_hash([row.get(field) for field in ROW_FINGERPRINT_FIELDS])
+
+
+def get_hash(values):
+    return hashlib.md5(json.dumps(values, default=str).encode()).hexdigest()
@@ -0,0 +1,57 @@
+# Copyright (c) 2024, Wahni IT Solutions Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import frappe
+
+TREE_CACHE_KEY = "pricing_scheme:nested_set"
+
+
+def get_tree(doctype):
+    """Return `{name: (lft, rgt, parent)}` for every node of a nested set doctype."""
+    return frappe.cache.hget(
+        TREE_CACHE_KEY, doctype, generator=lambda: build_tree(doctype)
+    )
+
+
+def build_tree(doctype):
+    parent_field = "parent_" + frappe.scrub(doctype)
+    return {
+        d.name: (d.lft, d.rgt, d.get(parent_field))
+        for d in frappe.get_all(doctype, fields=["name", "lft", "rgt", parent_field])
+    }
+
+
+def clear_tree_cache(doc, method=None, *args):
+    frappe.cache.hdel(TREE_CACHE_KEY, doc.doctype)
+
+
+def get_ancestors(doctype, name):
+    """Return `name` followed by its ancestors, nearest first."""
+    tree = get_tree(doctype)
+    ancestors = []
+    while name and name in tree and len(ancestors) < len(tree):
+        ancestors.append(name)
+        name = tree[name][2]
+
+    return ancestors
+
+
+def is_descendant_of(doctype, name, ancestor):
+    """Return True if `name` is `ancestor` or lies under it, using cached lft/rgt bounds."""
+    tree = get_tree(doctype)
+    if name not in tree or ancestor not in tree:
+        return False
+
+    lft, rgt, _ = tree[name]
+    ancestor_lft, ancestor_rgt, _ = tree[ancestor]
+    return ancestor_lft <= lft and rgt <= ancestor_rgt
+
+
+def get_descendants(doctype, name):
+    """Return `name` followed by every node under it."""
+    tree = get_tree(doctype)
+    if name not in tree:
+        return []
+
+    lft, rgt, _ = tree[name]
+    return [name] + [d for d, (d_lft, d_rgt, _) in tree.items() if d_lft > lft and d_rgt < rgt]
@@ -2,24 +2,97 @@
 # For license information, please see license.txt
 
 import frappe
+from frappe import _
 import json
-import copy
-from frappe.utils import cint, floor, flt
+import unicodedata
+from contextlib import contextmanager
+from functools import lru_cache
+from frappe.model.document import Document
+from frappe.utils import cint, cstr, floor, flt
 from erpnext.accounts.doctype.pricing_rule.pricing_rule import (
     set_transaction_type,
     update_args_for_pricing_rule,
 )
-from erpnext.setup.doctype.item_group.item_group import get_child_item_groups
-from erpnext.accounts.doctype.pricing_rule.utils import (
-    get_pricing_rule_items,
-    _get_pricing_rules,
-    get_other_conditions,
+from erpnext.accounts.doctype.pricing_rule.utils import get_pricing_rule_items
+from pricing_scheme.utils.nested_set import get_ancestors, get_descendants
+from pricing_scheme.utils.profiler import (
+    finish_profile,
+    profile_stage,
+    start_profile,
+    stop_profile,
 )
+from pricing_scheme.utils.rule_index import (
+    get_candidate_rules,
+    get_rule_index,
+    get_slab_bounds,
+    get_transaction_rules,
+    has_pricing_rules,
+)
+
+try:
+    from frappe.utils.safe_exec import (
+        WHITELISTED_SAFE_EVAL_GLOBALS,
+        FrappeTransformer,
+        _validate_safe_eval_syntax,
+    )
+    from RestrictedPython import compile_restricted
+except ImportError:
+    # Conditions fall back to frappe.safe_eval on every call
+    compile_restricted = None
+
+RULE_DETAILS_KEY = "pricing_scheme:rule_details"
 
 apply_on_table = {"Item Code": "items", "Item Group": "item_groups", "Brand": "brands"}
 
+rule_detail_tables = {
+    "free_items": (
+        "Pricing Rule Free Item",
+        "has_multiple_free_items",
+        ["item_code", "uom", "description", "item_name", "unit_weight"],
+    ),
+    "item_group_wise_discounts": (
+        "Pricing Rule Discount",
+        "has_item_group_wise_discounts",
+        ["item_group", "discount_percentage"],
+    ),
+}
+
+# Rule details only needed once a scheme is selected, see
+# `pricing_scheme.get_scheme_details`
+scheme_detail_fields = (
+    "free_items",
+    "item_wise_rates",
+    "item_group_wise_discounts",
+    "item_wise_discounts",
+)
 
-def apply_pricing_rule(args, doc=None):
+# Item wise tables can run to thousands of rows, so they are not part of the
+# cached details; `add_item_wise_values` reads the rows of the order's items
+item_wise_tables = {
+    "item_wise_rates": ("Pricing Rule Rate", "has_item_wise_rates", "rate"),
+    "item_wise_discounts": (
+        "Pricing Rule Item Discount",
+        "has_item_wise_discounts",
+        "discount_percentage",
+    ),
+}
+
+
+def apply_pricing_rule(args, doc=None, summary=False):
+    with start_evaluation(args, doc) as (context, item_list):
+        if not context:
+            return {"rules": {}, "items": {}, "applied_schemes": {}}
+
+        return finish_evaluation(
+            context,
+            [evaluate_item(context, item) for item in item_list],
+            summary=summary,
+        )
+
+
+@contextmanager
+def start_evaluation(args, doc=None):
+    """Yield the evaluation context of `doc` with its lines, detaching the profile on exit."""
     if isinstance(args, str):
         args = json.loads(args)
 
@@ -28,39 +101,59 @@ def apply_pricing_rule(args, doc=None):
     if not args.transaction_type:
         set_transaction_type(args)
 
+    if args.get("doctype") == "Material Request":
+        yield None, []
+        return
+
+    item_list = args.pop("items", [])
+
+    doc = get_transaction_doc(doc)
+    with evaluation_cache(doc, args) as context:
+        start_profile(context)
+        try:
+            with profile_stage(context, "prefetch"):
+                prefetch_order_details(context, item_list)
+
+            yield context, item_list
+        finally:
+            stop_profile(context)
+
+
+def evaluate_item(context, item):
+    args_copy = get_line_args(context, item)
+    data, _rules = get_applicable_rules_for_item(args_copy, doc=context.doc)
+    return frappe._dict(item=item, args=args_copy, data=data, rules=_rules)
+
+
+def finish_evaluation(
+    context, evaluated_items, with_transaction_rules=True, summary=False
+):
+    """Build the `get_pricing_rules` response; `summary` leaves out `scheme_detail_fields`."""
+    doc, args = context.doc, context.args
     out = {
         "rules": {},
         "items": {},
         "applied_schemes": {},
     }
+    get_details = get_pricing_rule_summary if summary else get_pricing_rule_details
 
-    if args.get("doctype") == "Material Request":
-        return out
-
-    item_list = args.pop("items", [])
-
-    item_code_list = tuple(item.get("item_code") for item in item_list)
-    query_items = frappe.get_all(
-        "Item",
-        fields=["item_code", "has_serial_no"],
-        filters=[["item_code", "in", item_code_list]],
-        as_list=1,
-    )
-    serialized_items = dict()
-    for item_code, val in query_items:
-        serialized_items.setdefault(item_code, val)
+    with profile_stage(context, "details"):
+        if not summary:
+            load_pricing_rule_details(
+                [rule for row in evaluated_items for rule in row.rules.values()]
+            )
 
     _stock_qty = 0
-    for item in item_list:
+    for row in evaluated_items:
+        item, args_copy, data, _rules = row.item, row.args, row.data, row.rules
         _stock_qty += item.get("stock_qty", 0)
-        args_copy = copy.deepcopy(args)
-        args_copy.update(item)
-        data, _rules = get_pricing_rule_for_item(args_copy, doc=doc)
         for rule in _rules.keys():
             if out["rules"].get(rule):
                 out["rules"][rule]["applicable_items"].append(item.get("name"))
+                if not summary:
+                    add_item_group_discount(out["rules"][rule], args_copy.item_group)
             else:
-                out["rules"].update({rule: _rules[rule]})
+                out["rules"].update({rule: get_details(args_copy, _rules[rule])})
                 out["rules"][rule]["applicable_items"] = [item.get("name")]
         if data:
             out["items"].update(
@@ -80,43 +173,194 @@ def apply_pricing_rule(args, doc=None):
             out["applied_schemes"].setdefault(
                 scheme,
                 {
-                    "title": frappe.db.get_value("Pricing Rule", scheme, "title"),
+                    "title": context.scheme_titles.get(scheme),
                     "items": [],
                 },
             )
             out["applied_schemes"][scheme]["items"].append(item.get("name"))
 
-    for tr_rule in filter_pricing_rule_based_on_condition(
-        get_transaction_based_rules(doc), doc
-    ):
-        if doc.get("pricing_scheme") == tr_rule.name:
-            continue
+    with profile_stage(context, "transaction_rules") as stage:
+        tr_rules = [
+            tr_rule
+            for tr_rule in filter_pricing_rule_based_on_condition(
+                get_transaction_based_rules(doc) if with_transaction_rules else [], doc
+            )
+            if doc.get("pricing_scheme") != tr_rule.name
+        ]
+        qtys = [
+            doc.total_net_weight if tr_rule.qty_based_on != "Stock" else _stock_qty
+            for tr_rule in tr_rules
+        ]
+        transaction_rules = [
+            tr_rule
+            for tr_rule, applicable in zip(
+                tr_rules,
+                get_slab_mask(tr_rules, qtys, [doc.net_total] * len(tr_rules)),
+                strict=True,
+            )
+            if applicable
+        ]
+        stage["rows"] = len(transaction_rules)
+
+    with profile_stage(context, "details"):
+        if not summary:
+            load_pricing_rule_details(transaction_rules)
 
-        if tr_rule.qty_based_on != "Stock":
-            _stock_qty = doc.total_net_weight
-        amount = doc.net_total
-        if filter_pricing_rules_for_qty_amount(_stock_qty, amount, tr_rule, args):
-            out["rules"].update({tr_rule.name: get_pricing_rule_details(args, tr_rule)})
+        for tr_rule in transaction_rules:
+            out["rules"].update({tr_rule.name: get_details(args, tr_rule)})
+
+        if not summary:
+            add_item_wise_values(
+                out["rules"], [row.item.get("item_code") for row in evaluated_items]
+            )
 
     if scheme := doc.get("pricing_scheme"):
         out["applied_schemes"].setdefault(
             scheme,
             {
-                "title": frappe.db.get_value("Pricing Rule", scheme, "title"),
+                "title": context.scheme_titles.get(scheme),
                 "items": [],
             },
         )
 
+    if debug := finish_profile(context, len(evaluated_items)):
+        out["_debug"] = debug
+
     return out
 
 
-def get_pricing_rule_for_item(args, doc=None, for_validate=False):
+def get_transaction_doc(doc):
     if isinstance(doc, str):
         doc = json.loads(doc)
 
-    if doc:
+    if not isinstance(doc, Document):
         doc = frappe.get_doc(doc)
 
+    return doc
+
+
+@contextmanager
+def evaluation_cache(doc, args=None):
+    """Keep one evaluation context on `doc.flags` for the block."""
+    previous = doc.flags.pricing_evaluation_context
+    doc.flags.pricing_evaluation_context = new_evaluation_context(doc, args)
+    try:
+        yield doc.flags.pricing_evaluation_context
+    finally:
+        doc.flags.pricing_evaluation_context = previous
+
+
+def get_evaluation_context(doc):
+    """Return the open evaluation context of `doc`, or a new one for this call only."""
+    if doc.flags.pricing_evaluation_context is None:
+        return new_evaluation_context(doc)
+
+    return doc.flags.pricing_evaluation_context
+
+
+def new_evaluation_context(doc, args=None):
+    return frappe._dict(
+        doc=doc,
+        args=frappe._dict(args or {}),
+        doc_dict=None,
+        mixed_condition_totals=None,
+        item_master=None,
+        scheme_titles={},
+        allowed_rules=None,
+        profile=None,
+    )
+
+
+def prefetch_order_details(context, item_list):
+    """Load the item master data and scheme titles of the whole order."""
+    context.item_master = {}
+    item_codes = {item.get("item_code") for item in item_list if item.get("item_code")}
+    if item_codes:
+        for d in frappe.get_all(
+            "Item",
+            filters={"item_code": ["in", list(item_codes)]},
+            fields=["item_code", "item_group", "brand", "variant_of"],
+        ):
+            context.item_master[d.item_code] = d
+
+    context.scheme_titles = {}
+    schemes = {item.get("pricing_scheme") for item in item_list}
+    schemes.add(context.doc.get("pricing_scheme"))
+    schemes = [scheme for scheme in schemes if scheme]
+    if schemes:
+        context.scheme_titles = dict(
+            frappe.get_all(
+                "Pricing Rule",
+                filters={"name": ["in", schemes]},
+                fields=["name", "title"],
+                as_list=1,
+            )
+        )
+
+
+def update_line_args(args, item_master):
+    """Same as `update_args_for_pricing_rule`, reading the item from prefetched data."""
+    item = item_master.get(args.item_code)
+    if not (args.item_group and args.brand):
+        if not item:
+            return
+
+        args.item_group, args.brand = item.item_group, item.brand
+        if not args.item_group:
+            frappe.throw(
+                _("Item Group not mentioned in item master for item {0}").format(
+                    args.item_code
+                )
+            )
+
+    if "variant_of" not in args:
+        args.variant_of = item.variant_of if item else None
+
+    if args.transaction_type == "selling":
+        if args.customer and not (args.customer_group and args.territory):
+            if args.quotation_to and args.quotation_to != "Customer":
+                customer = frappe._dict()
+            else:
+                customer = frappe.get_cached_value(
+                    "Customer", args.customer, ["customer_group", "territory"]
+                )
+
+            if customer:
+                args.customer_group, args.territory = customer
+
+        args.supplier = args.supplier_group = None
+
+    elif args.supplier and not args.supplier_group:
+        args.supplier_group = frappe.get_cached_value(
+            "Supplier", args.supplier, "supplier_group"
+        )
+        args.customer = args.customer_group = args.territory = None
+
+
+def get_line_args(context, item):
+    """Overlay a line's fields on a shallow copy of the common args."""
+    line_args = frappe._dict(context.args)
+    line_args.update(item)
+    return line_args
+
+
+def get_pricing_rule_for_item(args, doc=None, for_validate=False):
+    item_details, pricing_rules = get_applicable_rules_for_item(args, doc=doc)
+    load_pricing_rule_details(pricing_rules.values())
+
+    rules = {
+        name: get_pricing_rule_details(args, pricing_rule)
+        for name, pricing_rule in pricing_rules.items()
+    }
+    add_item_wise_values(rules, [args.item_code])
+
+    return item_details, rules
+
+
+def get_applicable_rules_for_item(args, doc=None):
+    if doc:
+        doc = get_transaction_doc(doc)
+
     if args.get("pricing_scheme"):
         return {}, {}
 
@@ -138,7 +382,11 @@ def get_pricing_rule_for_item(args, doc=None, for_validate=False):
     if not args.item_code:
         return item_details, {}
 
-    update_args_for_pricing_rule(args)
+    context = get_evaluation_context(doc) if doc else None
+    if context and context.item_master is not None:
+        update_line_args(args, context.item_master)
+    else:
+        update_args_for_pricing_rule(args)
 
     pricing_rules = get_pricing_rules(args, doc)
     rules = {}
@@ -154,9 +402,7 @@ def get_pricing_rule_for_item(args, doc=None, for_validate=False):
             if pricing_rule.get("suggestion"):
                 continue
 
-            rules.update(
-                {pricing_rule.name: get_pricing_rule_details(args, pricing_rule)}
-            )
+            rules.setdefault(pricing_rule.name, pricing_rule)
 
         item_details.has_pricing_rule = 1
         item_details.pricing_rules = [d for d in rules.keys()]
@@ -165,63 +411,148 @@ def get_pricing_rule_for_item(args, doc=None, for_validate=False):
 
 
 def get_pricing_rule_details(args, pricing_rule):
-    free_items = []
-    if pricing_rule.get("has_multiple_free_items"):
-        free_items = frappe.get_all(
-            "Pricing Rule Free Item",
-            filters={"parent": pricing_rule.name, "parenttype": "Pricing Rule"},
-            fields=["item_code", "uom", "description", "item_name", "unit_weight"],
-        )
+    details = get_rule_details_cache().get(pricing_rule.name)
+    if not details:
+        load_pricing_rule_details([pricing_rule])
+        details = get_rule_details_cache()[pricing_rule.name]
+
+    details = frappe._dict(
+        details,
+        item_code=args.get("item_code"),
+        child_docname=args.get("child_docname"),
+        item_group_wise_discounts={},
+    )
+    add_item_group_discount(details, args.get("item_group"))
 
-    item_wise_rates = {}
-    if pricing_rule.get("has_item_wise_rates"):
-        item_wise_rates = dict(
-            frappe.get_all(
-                "Pricing Rule Rate",
-                filters={"parent": pricing_rule.name, "parenttype": "Pricing Rule"},
-                fields=["item_code", "rate"],
-                as_list=1,
-            )
-        )
+    return details
 
-    item_group_wise_discounts = {}
-    if pricing_rule.get("has_item_group_wise_discounts"):
-        item_group_wise_discounts = dict(
-            frappe.get_all(
-                "Pricing Rule Discount",
-                filters={"parent": pricing_rule.name, "parenttype": "Pricing Rule"},
-                fields=["item_group", "discount_percentage"],
-                as_list=1,
-            )
-        )
-        item_sub_groups = {}
-        for item_group in item_group_wise_discounts.keys():
-            item_sub_groups[item_group] = get_child_item_groups(item_group)
 
-        for grp, children in item_sub_groups.items():
-            for child in children:
-                item_group_wise_discounts[child] = item_group_wise_discounts[grp]
+def get_pricing_rule_summary(args, pricing_rule):
+    """Return the details of `pricing_rule` without reading its child tables."""
+    details = build_pricing_rule_details(
+        pricing_rule, {table: [] for table in rule_detail_tables}
+    )
+    for field in scheme_detail_fields:
+        del details[field]
 
-    item_wise_discounts = {}
-    if pricing_rule.get("has_item_wise_discounts"):
-        item_wise_discounts = dict(
-            frappe.get_all(
-                "Pricing Rule Item Discount",
-                filters={"parent": pricing_rule.name, "parenttype": "Pricing Rule"},
-                fields=["item_code", "discount_percentage"],
-                as_list=1,
-            )
+    details.update(
+        item_code=args.get("item_code"), child_docname=args.get("child_docname")
+    )
+    return details
+
+
+def add_item_group_discount(details, item_group):
+    """Set the rule's discount for `item_group` from its nearest configured ancestor."""
+    discounts = get_rule_details_cache()[details.pricing_rule].item_group_wise_discounts
+    if not discounts or not item_group or item_group in details.item_group_wise_discounts:
+        return
+
+    for group in get_ancestors("Item Group", item_group):
+        if group in discounts:
+            details.item_group_wise_discounts[item_group] = discounts[group]
+            return
+
+
+def add_item_wise_values(rules, item_codes):
+    """Set the item wise rates and discounts of `rules` for `item_codes` only."""
+    item_codes = list({item_code for item_code in item_codes if item_code})
+    for details in rules.values():
+        for field in item_wise_tables:
+            details[field] = {}
+
+    if not item_codes:
+        return
+
+    for field, (doctype, check_field, value_field) in item_wise_tables.items():
+        parents = [name for name, details in rules.items() if details.get(check_field)]
+        if not parents:
+            continue
+
+        for row in frappe.get_all(
+            doctype,
+            filters={
+                "parenttype": "Pricing Rule",
+                "parent": ["in", parents],
+                "item_code": ["in", item_codes],
+            },
+            fields=["parent", "item_code", value_field],
+        ):
+            rules[row.parent][field][row.item_code] = row[value_field]
+
+
+def get_rule_details_cache():
+    if not hasattr(frappe.local, "pricing_rule_details"):
+        frappe.local.pricing_rule_details = {}
+
+    return frappe.local.pricing_rule_details
+
+
+def load_pricing_rule_details(pricing_rules):
+    """Cache the details of `pricing_rules`, reading each child table once for all of them."""
+    cache = get_rule_details_cache()
+    pending = {}
+    for pricing_rule in pricing_rules:
+        if pricing_rule.name not in cache:
+            pending.setdefault(pricing_rule.name, pricing_rule)
+
+    for name, pricing_rule in list(pending.items()):
+        cached = frappe.cache.hget(RULE_DETAILS_KEY, name)
+        if cached and cached["modified"] == cstr(pricing_rule.modified):
+            cache[name] = cached["details"]
+            del pending[name]
+
+    if not pending:
+        return
+
+    child_rows = {}
+    for table, (doctype, check_field, fields) in rule_detail_tables.items():
+        parents = [name for name, rule in pending.items() if rule.get(check_field)]
+        if not parents:
+            continue
+
+        for row in frappe.get_all(
+            doctype,
+            filters={"parent": ["in", parents], "parenttype": "Pricing Rule"},
+            fields=["parent", *fields],
+        ):
+            child_rows.setdefault((row.pop("parent"), table), []).append(row)
+
+    for name, pricing_rule in pending.items():
+        cache[name] = build_pricing_rule_details(
+            pricing_rule,
+            {table: child_rows.get((name, table), []) for table in rule_detail_tables},
+        )
+        frappe.cache.hset(
+            RULE_DETAILS_KEY,
+            name,
+            {"modified": cstr(pricing_rule.modified), "details": cache[name]},
         )
 
+
+def clear_pricing_rule_details(doc, method=None, *args):
+    frappe.cache.hdel(RULE_DETAILS_KEY, doc.name)
+    if method == "after_rename" and args:
+        frappe.cache.hdel(RULE_DETAILS_KEY, args[0])
+
+
+def build_pricing_rule_details(pricing_rule, child_rows):
+    free_items = child_rows["free_items"]
+
+    item_group_wise_discounts = {
+        d.item_group: d.discount_percentage
+        for d in child_rows["item_group_wise_discounts"]
+    }
+
     return frappe._dict(
         {
             "pricing_rule": pricing_rule.name,
             "rate_or_discount": pricing_rule.rate_or_discount,
             "margin_type": pricing_rule.margin_type,
-            "item_code": args.get("item_code"),
-            "child_docname": args.get("child_docname"),
+            "item_code": None,
+            "child_docname": None,
             "free_items": free_items,
-            "item_wise_rates": item_wise_rates,
+            "item_wise_rates": {},
+            "has_item_wise_rates": pricing_rule.has_item_wise_rates,
             "title": pricing_rule.title,
             "recurse_for": pricing_rule.recurse_for,
             "free_qty": pricing_rule.free_qty,
@@ -243,24 +574,29 @@ def get_pricing_rule_details(args, pricing_rule):
             "auto_apply_scheme": pricing_rule.auto_apply_scheme,
             "allow_skipping": pricing_rule.allow_skipping,
             "item_group_wise_discounts": item_group_wise_discounts,
-            "item_wise_discounts": item_wise_discounts,
+            "item_wise_discounts": {},
+            "has_item_wise_discounts": pricing_rule.has_item_wise_discounts,
         }
     )
 
 
 def get_pricing_rules(args, doc=None):
-    pricing_rules = []
-    values = {}
-
-    if not frappe.db.exists("Pricing Rule", {"disable": 0, args.transaction_type: 1}):
+    if not has_pricing_rules(args.transaction_type):
         return
 
-    for apply_on in ["Item Code", "Item Group", "Brand"]:
-        pricing_rules.extend(_get_pricing_rules(apply_on, args, values))
+    context = get_evaluation_context(doc) if doc else None
+    with profile_stage(context, "candidates") as stage:
+        pricing_rules = get_candidate_rules(args)
+        allowed_rules = context.allowed_rules if context else None
+        if allowed_rules is not None:
+            pricing_rules = [d for d in pricing_rules if d.name in allowed_rules]
+        stage["rows"] = len(pricing_rules)
 
     rules = []
 
-    pricing_rules = filter_pricing_rule_based_on_condition(pricing_rules, doc)
+    with profile_stage(context, "conditions") as stage:
+        pricing_rules = filter_pricing_rule_based_on_condition(pricing_rules, doc)
+        stage["rows"] = len(pricing_rules)
 
     if not pricing_rules:
         return []
@@ -276,63 +612,33 @@ def get_pricing_rules(args, doc=None):
 
 
 def get_transaction_based_rules(doc):
-    conditions = "apply_on = 'Transaction'"
-
-    values = {}
-    conditions = get_other_conditions(conditions, values, doc)
-
-    return frappe.db.sql(
-        f""" Select `tabPricing Rule`.* from `tabPricing Rule`
-		where  {conditions} and `tabPricing Rule`.disable = 0
-	""",
-        values,
-        as_dict=1,
-    )
+    return get_transaction_rules(doc)
 
 
 def filter_pricing_rules_for_qty_amount(qty, rate, rule, args=None):
-    status = False
-    conversion_factor = 1
-
-    if flt(qty) >= (flt(rule.min_qty) * conversion_factor) and (
-        flt(qty) <= (rule.max_qty * conversion_factor) if rule.max_qty else True
-    ):
-        status = True
-
-    if status and (
-        flt(rate) >= (flt(rule.min_amt) * conversion_factor)
-        and (flt(rate) <= (rule.max_amt * conversion_factor) if rule.max_amt else True)
-    ):
-        status = True
-    else:
-        status = False
-
-    return status
+    min_qty, max_qty, min_amt, max_amt = get_slab_bounds(rule)
+    return min_qty <= flt(qty) <= max_qty and min_amt <= flt(rate) <= max_amt
+
+
+def get_slab_mask(rules, qtys, amounts):
+    """Return, for each rule and its aligned qty and amount, whether its slab allows them."""
+    slabs = get_rule_index().slabs
+    return [
+        min_qty <= flt(qty) <= max_qty and min_amt <= flt(amount) <= max_amt
+        for (min_qty, max_qty, min_amt, max_amt), qty, amount in zip(
+            [slabs.get(rule.name) or get_slab_bounds(rule) for rule in rules],
+            qtys,
+            amounts,
+            strict=True,
+        )
+    ]
 
 
 def filter_pricing_rules(args, pricing_rules, doc=None):
     if not isinstance(pricing_rules, list):
         pricing_rules = [pricing_rules]
 
-    original_pricing_rule = copy.copy(pricing_rules)
-    # filter for qty
-    pricing_rules = []
-    for rule in original_pricing_rule:
-        if rule.territory and not args.get("territory"):
-            continue
-
-        stock_qty = flt(args.get("stock_qty"))
-        amount = flt(args.get("net_amount"))
-
-        pr_doc = frappe.get_cached_doc("Pricing Rule", rule.name)
-        if pr_doc.qty_based_on == "Weight":
-            stock_qty = flt(args.get("total_weight"))
-
-        if rule.mixed_conditions and doc:
-            stock_qty, amount = get_qty_and_rate_for_mixed_conditions(doc, pr_doc, args)
-
-        if filter_pricing_rules_for_qty_amount(stock_qty, amount, rule, args):
-            pricing_rules.append(rule)
+    pricing_rules = filter_rules_by_slab(args, pricing_rules, doc)
 
     if len(pricing_rules) > 1:
         filtered_rules = list(
@@ -347,35 +653,101 @@ def filter_pricing_rules(args, pricing_rules, doc=None):
     return pricing_rules
 
 
+def filter_rules_by_slab(args, pricing_rules, doc=None):
+    slabs = get_rule_index().slabs
+    return [rule for rule in pricing_rules if is_in_slab(args, rule, doc, slabs)]
+
+
+def is_in_slab(args, rule, doc, slabs):
+    if rule.territory and not args.get("territory"):
+        return False
+
+    stock_qty = flt(args.get("stock_qty"))
+    amount = flt(args.get("net_amount"))
+
+    if rule.qty_based_on == "Weight":
+        stock_qty = flt(args.get("total_weight"))
+
+    if rule.mixed_conditions and doc:
+        stock_qty, amount = get_qty_and_rate_for_mixed_conditions(doc, rule, args)
+
+    min_qty, max_qty, min_amt, max_amt = slabs.get(rule.name) or get_slab_bounds(rule)
+    return min_qty <= flt(stock_qty) <= max_qty and min_amt <= flt(amount) <= max_amt
+
+
 def get_qty_and_rate_for_mixed_conditions(doc, pr_doc, args):
-    sum_qty, sum_amt = [0, 0]
-    items = get_pricing_rule_items(pr_doc) or []
+    totals = get_mixed_condition_totals(doc)
     apply_on = frappe.scrub(pr_doc.get("apply_on"))
+    key = (pr_doc.name, args.get("validate_for"), args.get(apply_on))
+    if key in totals.results:
+        return totals.results[key]
 
-    if items and doc.get("items"):
-        for row in doc.get("items"):
-            if row.get("is_free_item"):
-                continue
+    if pr_doc.name not in totals.rule_items:
+        totals.rule_items[pr_doc.name] = get_rule_items(pr_doc)
 
-            if row.get("pricing_scheme"):
-                if args.get("validate_for") != row.get("pricing_scheme"):
+    items = totals.rule_items[pr_doc.name]
+    sum_qty, sum_amt = [0, 0]
+    if items:
+        for scheme in {None, args.get("validate_for")}:
+            for value, (stock_qty, weight, amt) in totals.buckets.get(
+                (apply_on, scheme), {}
+            ).items():
+                if (value or args.get(apply_on)) not in items:
                     continue
 
-            if (row.get(apply_on) or args.get(apply_on)) not in items:
+                sum_qty += stock_qty if pr_doc.qty_based_on == "Stock" else weight
+                sum_amt += amt
+
+    totals.results[key] = (sum_qty, sum_amt)
+    return totals.results[key]
+
+
+def get_rule_items(rule):
+    """Same as `get_pricing_rule_items`, reading the rule's values from the rule index."""
+    values = get_rule_index().rule_items.get(rule.name)
+    if values is None:
+        pr_doc = frappe.get_cached_doc("Pricing Rule", rule.name)
+        return set(get_pricing_rule_items(pr_doc) or [])
+
+    items = set()
+    for value in values:
+        if rule.apply_on == "Item Group":
+            items.update(get_descendants("Item Group", value))
+        else:
+            items.add(value)
+
+    if rule.apply_rule_on_other:
+        items.add(rule.get("other_" + frappe.scrub(rule.apply_rule_on_other)))
+
+    return items
+
+
+def get_mixed_condition_totals(doc):
+    """Return the order's qty, weight and amount per apply on value and scheme."""
+    context = get_evaluation_context(doc)
+    if context.mixed_condition_totals is None:
+        buckets = {}
+        for row in doc.get("items") or []:
+            if row.get("is_free_item"):
                 continue
 
             amt = flt(row.get("amount"))
             if row.get("price_list_rate"):
                 amt = flt(row.get("price_list_rate") * row.get("qty"))
 
-            sum_qty += (
-                flt(row.get("stock_qty"))
-                if pr_doc.qty_based_on == "Stock"
-                else flt(row.get("total_weight"))
-            )
-            sum_amt += amt
+            for apply_on in ("item_code", "item_group", "brand"):
+                bucket = buckets.setdefault(
+                    (apply_on, row.get("pricing_scheme") or None), {}
+                ).setdefault(row.get(apply_on) or None, [0, 0, 0])
+                bucket[0] += flt(row.get("stock_qty"))
+                bucket[1] += flt(row.get("total_weight"))
+                bucket[2] += amt
 
-    return sum_qty, sum_amt
+        context.mixed_condition_totals = frappe._dict(
+            buckets=buckets, rule_items={}, results={}
+        )
+
+    return context.mixed_condition_totals
 
 
 def get_free_item_qty(rule, stock_qty):
@@ -397,10 +769,22 @@ def sorted_by_priority(pricing_rules, args, doc=None):
     # If more than one pricing rules, then sort by priority
     pricing_rules_list = []
     pricing_rule_dict = {}
+    context = get_evaluation_context(doc) if doc else None
 
+    # Each rule is filtered on its own, so the currency preference of
+    # `filter_pricing_rules` between several rules does not apply here
+    slabs = get_rule_index().slabs
+    filtered_rules = []
     for pricing_rule in pricing_rules:
-        prules = filter_pricing_rules(args, pricing_rule, doc)
-        for rule in prules:
+        with profile_stage(context, "qty_filter", pricing_rule.name) as stage:
+            applicable = is_in_slab(args, pricing_rule, doc, slabs)
+            stage["rows"] = int(applicable)
+
+        if applicable:
+            filtered_rules.append(pricing_rule)
+
+    with profile_stage(context, "priority_sort") as stage:
+        for rule in filtered_rules:
             if not rule.get("priority"):
                 rule["priority"] = 4
                 if rule.get("customer"):
@@ -412,8 +796,10 @@ def sorted_by_priority(pricing_rules, args, doc=None):
 
             pricing_rule_dict.setdefault(cint(rule.get("priority")), []).append(rule)
 
-    for key in sorted(pricing_rule_dict):
-        pricing_rules_list.extend(pricing_rule_dict.get(key))
+        for key in sorted(pricing_rule_dict):
+            pricing_rules_list.extend(pricing_rule_dict.get(key))
+
+        stage["rows"] = len(pricing_rules_list)
 
     return pricing_rules_list
 
@@ -421,16 +807,69 @@ def sorted_by_priority(pricing_rules, args, doc=None):
 def filter_pricing_rule_based_on_condition(pricing_rules, doc=None):
     filtered_pricing_rules = []
     if doc:
+        context = get_evaluation_context(doc)
         for pricing_rule in pricing_rules:
             if pricing_rule.condition:
-                try:
-                    if frappe.safe_eval(pricing_rule.condition, None, doc.as_dict()):
-                        filtered_pricing_rules.append(pricing_rule)
-                except Exception:
-                    pass
+                with profile_stage(context, "condition_eval", pricing_rule.name):
+                    applicable = evaluate_condition(
+                        pricing_rule, get_condition_context(doc)
+                    )
+                if applicable:
+                    filtered_pricing_rules.append(pricing_rule)
             else:
                 filtered_pricing_rules.append(pricing_rule)
     else:
         filtered_pricing_rules = pricing_rules
 
     return filtered_pricing_rules
+
+
+def get_condition_context(doc):
+    """Return the `as_dict` snapshot conditions are evaluated against."""
+    context = get_evaluation_context(doc)
+    if context.doc_dict is None:
+        context.doc_dict = doc.as_dict()
+
+    return context.doc_dict
+
+
+def evaluate_condition(pricing_rule, context):
+    code = compile_condition(
+        frappe.local.site,
+        pricing_rule.name,
+        cstr(pricing_rule.modified),
+        pricing_rule.condition,
+    )
+    if code is None:
+        return False
+
+    try:
+        if isinstance(code, str):
+            return frappe.safe_eval(code, None, context)
+        return eval(code, {"__builtins__": {}, **WHITELISTED_SAFE_EVAL_GLOBALS}, context)
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=1024)
+def compile_condition(site, pricing_rule, modified, condition):
+    """Compile a rule's condition as `frappe.safe_eval` does; None if it does not compile."""
+    if not compile_restricted:
+        return condition
+
+    try:
+        condition = unicodedata.normalize("NFKC", condition)
+        _validate_safe_eval_syntax(condition)
+        return compile_restricted(
+            condition,
+            filename=f"<pricing rule {pricing_rule}>",
+            policy=FrappeTransformer,
+            mode="eval",
+        )
+    except Exception:
+        frappe.log_error(
+            title=f"Invalid condition in Pricing Rule {pricing_rule}",
+            reference_doctype="Pricing Rule",
+            reference_name=pricing_rule,
+            defer_insert=True,
+        )
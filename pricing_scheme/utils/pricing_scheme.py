@@ -1,30 +1,130 @@
 # Copyright (c) 2023, Wahni IT Solutions Pvt. Ltd. and contributors
 # For license information, please see license.txt
 
+import hashlib
 import json
 
 import frappe
 from frappe import _
+from frappe.utils import cint, cstr, flt
 from pricing_scheme.utils.pricing_rule import (
+    add_item_group_discount,
+    add_item_wise_values,
     apply_pricing_rule,
+    evaluate_item,
+    evaluation_cache,
     filter_pricing_rule_based_on_condition,
     filter_pricing_rules_for_qty_amount,
+    finish_evaluation,
+    get_pricing_rule_details,
     get_qty_and_rate_for_mixed_conditions,
+    get_slab_mask,
+    scheme_detail_fields,
+    start_evaluation,
 )
+from pricing_scheme.utils.compact import RESPONSE_FORMAT, compact_response
+from pricing_scheme.utils.nested_set import get_descendants, is_descendant_of
+from pricing_scheme.utils.rule_index import (
+    get_auto_apply_rules,
+    get_rule_index,
+    get_rule_index_version,
+    get_rule_records,
+)
+
+scheme_header_fields = [
+    "company",
+    "customer",
+    "customer_group",
+    "territory",
+    "transaction_date",
+    "currency",
+    "selling_price_list",
+]
+
+# Row fields that cannot be edited once a scheme is applied
+scheme_locked_fields = [
+    "qty",
+    "rate",
+    "discount_percentage",
+    "discount_amount",
+    "price_list_rate",
+    "margin_rate_or_amount",
+]
+
+# Order level discount fields that change the rows' net amounts
+scheme_discount_fields = [
+    "additional_discount_percentage",
+    "discount_amount",
+    "apply_discount_on",
+]
+
+scheme_row_fields = [
+    "pricing_scheme",
+    "item_code",
+    "item_group",
+    "brand",
+    "qty",
+    "stock_qty",
+    "total_weight",
+    "amount",
+    "net_amount",
+    "price_list_rate",
+    "is_free_item",
+]
 
 
 @frappe.whitelist()
-def get_pricing_rules(doc):
-    items = []
-    if isinstance(doc, str):
-        doc = json.loads(doc)
-        items = doc.get("items", [])
-        doc = frappe.get_doc(doc)
+def get_pricing_rules(doc, incremental=None, response_format=None, summary=None):
+    if incremental:
+        from pricing_scheme.utils.incremental import get_incremental_pricing_rules
+
+        out = get_incremental_pricing_rules(doc, incremental, cint(summary))
     else:
-        items = [d.as_dict() for d in doc.items]
+        items = []
+        if isinstance(doc, str):
+            doc = json.loads(doc)
+            items = doc.get("items", [])
+            doc = frappe.get_doc(doc)
+        else:
+            items = [d.as_dict() for d in doc.items]
+
+        out = apply_pricing_rule(
+            args=get_pricing_args(doc, items), doc=doc, summary=cint(summary)
+        )
+
+    if cint(response_format) == RESPONSE_FORMAT and "rules" in out:
+        out = compact_response(out)
+
+    return out
+
+
+@frappe.whitelist()
+def get_scheme_details(rule, items):
+    """Return the `scheme_detail_fields` of `rule` for the order's `items`."""
+    items = frappe.parse_json(items) or []
+    pricing_rules = get_rule_records({"name": rule, "disable": 0, "selling": 1})
+    if not pricing_rules:
+        frappe.throw(
+            _("Pricing Rule {0} is not an enabled selling scheme.").format(rule),
+            frappe.PermissionError,
+        )
+
+    details = get_pricing_rule_details(frappe._dict(), pricing_rules[0])
+    for item in items:
+        add_item_group_discount(details, item.get("item_group"))
+
+    add_item_wise_values({rule: details}, [item.get("item_code") for item in items])
 
-    args = {
-        "customer": doc.customer,
+    return {field: details[field] for field in scheme_detail_fields}
+
+
+def get_pricing_args(doc, items):
+    customer = doc.get("customer")
+    if doc.doctype == "Quotation" and doc.quotation_to == "Customer":
+        customer = doc.party_name
+
+    return {
+        "customer": customer,
         "customer_group": doc.customer_group,
         "territory": doc.territory,
         "currency": doc.currency,
@@ -35,16 +135,42 @@ def get_pricing_rules(doc):
         "company": doc.company,
         "transaction_date": doc.transaction_date,
         "ignore_pricing_rule": 0,
-        "doctype": "Sales Order",
+        "doctype": doc.doctype,
         "name": doc.name,
         "items": items,
     }
 
-    return apply_pricing_rule(args=args, doc=doc)
-
 
 def auto_apply_primary_scheme(doc, method=None):
-    rules = get_pricing_rules(doc)["rules"]
+    if is_pricing_unchanged(doc):
+        return
+
+    args = frappe._dict(get_pricing_args(doc, []))
+    auto_apply_rules = get_auto_apply_rules(args)
+    if not auto_apply_rules:
+        return
+
+    skip_all = all(
+        get_rule_index().rules[name].allow_skipping for name in auto_apply_rules
+    )
+    items = [
+        d.as_dict()
+        for d in doc.items
+        if not d.pricing_scheme
+        and not d.is_free_item
+        and not (skip_all and d.skip_auto_apply_scheme)
+    ]
+    if not items:
+        return
+
+    with start_evaluation(get_pricing_args(doc, items), doc) as (context, item_list):
+        context.allowed_rules = auto_apply_rules
+        rules = finish_evaluation(
+            context,
+            [evaluate_item(context, item) for item in item_list],
+            with_transaction_rules=False,
+        )["rules"]
+
     for scheme, rule in rules.items():
         if not rule.get("auto_apply_scheme"):
             continue
@@ -53,6 +179,7 @@ def auto_apply_primary_scheme(doc, method=None):
         if not rule.get("applicable_items"):
             continue
 
+        applicable_items = set(rule.applicable_items)
         for row in doc.items:
             if row.skip_auto_apply_scheme and rule.allow_skipping:
                 continue
@@ -60,32 +187,35 @@ def auto_apply_primary_scheme(doc, method=None):
             if row.pricing_scheme:
                 continue
 
-            if row.name not in rule.applicable_items:
+            if row.name not in applicable_items:
                 continue
 
             row.pricing_scheme = scheme
-            if rule.rate_or_discount == "Rate":
-                rate = rule.item_wise_rates.get(row.item_code) or rule.get("rate")
-                if rule.rate_based_on == "Weight":
-                    row.rate = rate * row.weight_per_unit
-                else:
-                    row.rate = rate
-            else:
-                field = frappe.scrub(rule.rate_or_discount)
-                row.set(field, rule.get(field))
-                if field == "discount_percentage":
-                    row.discount_percentage = (
-                        rule.item_wise_discounts.get(row.item_code)
-                        or rule.item_group_wise_discounts.get(row.item_group)
-                        or row.discount_percentage
-                    )
-                    row.discount_amount = (
-                        row.price_list_rate * row.discount_percentage / 100
-                    )
-                row.rate = row.price_list_rate - row.discount_amount
+            apply_scheme_rate(row, rule)
 
-            row.discount_amount = row.price_list_rate - row.rate
-            row.discount_percentage = row.discount_amount * 100 / row.price_list_rate
+
+def apply_scheme_rate(row, rule):
+    """Set the rate and discount of `row` from the details of a Price scheme."""
+    if rule.rate_or_discount == "Rate":
+        rate = rule.item_wise_rates.get(row.item_code) or rule.get("rate")
+        if rule.rate_based_on == "Weight":
+            row.rate = rate * row.weight_per_unit
+        else:
+            row.rate = rate
+    else:
+        field = frappe.scrub(rule.rate_or_discount)
+        row.set(field, rule.get(field))
+        if field == "discount_percentage":
+            row.discount_percentage = (
+                rule.item_wise_discounts.get(row.item_code)
+                or rule.item_group_wise_discounts.get(row.item_group)
+                or row.discount_percentage
+            )
+            row.discount_amount = row.price_list_rate * row.discount_percentage / 100
+        row.rate = row.price_list_rate - row.discount_amount
+
+    row.discount_amount = row.price_list_rate - row.rate
+    row.discount_percentage = row.discount_amount * 100 / row.price_list_rate
 
 
 @frappe.whitelist()
@@ -133,7 +263,46 @@ def is_scheme_applied(doc, method=None):
 
 
 def validate_applied_scheme(doc, method=None):
+    validate_locked_fields(doc)
+    if is_pricing_unchanged(doc):
+        with evaluation_cache(doc):
+            validate_scheme_conditions(doc)
+
+        doc.pricing_fingerprint = doc.get_doc_before_save().pricing_fingerprint
+        return
+
+    with evaluation_cache(doc):
+        validate_scheme_rows(doc)
+
+    doc.pricing_fingerprint = get_pricing_fingerprint(doc)
+
+
+def validate_locked_fields(doc):
+    for row in doc.items:
+        if row.is_free_item or not row.get("pricing_scheme"):
+            continue
+
+        old_row = row.get_doc_before_save()
+        if (
+            not old_row
+            or old_row.get("pricing_scheme") != row.pricing_scheme
+            or doc.flags.reapply_scheme == row.pricing_scheme
+        ):
+            continue
+
+        for field in scheme_locked_fields:
+            if row.has_value_changed(field):
+                frappe.throw(
+                    _(
+                        "Row #{0}: {1} cannot be edited as scheme is already applied."
+                    ).format(row.idx, row.meta.get_label(field))
+                )
+
+
+def validate_scheme_rows(doc):
+    changes = get_scheme_changes(doc)
     _stock_qty = 0
+    scheme_rows = {}
     for row in doc.items:
         _stock_qty += row.stock_qty
         if row.is_free_item:
@@ -144,34 +313,31 @@ def validate_applied_scheme(doc, method=None):
         if not row.get("pricing_scheme"):
             continue
 
-        old_row = row.get_doc_before_save()
-        if old_row and old_row.get("pricing_scheme") == row.pricing_scheme:
-            for field in [
-                "qty",
-                "rate",
-                "discount_percentage",
-                "discount_amount",
-                "price_list_rate",
-                "margin_rate_or_amount",
-            ]:
-                if row.has_value_changed(field):
-                    frappe.throw(
-                        _(
-                            "Row #{0}: {1} cannot be edited as scheme is already applied."
-                        ).format(row.idx, row.meta.get_label(field))
-                    )
+        scheme_rows.setdefault(row.pricing_scheme, []).append(row)
+
+    for scheme, rows in scheme_rows.items():
+        prule = frappe.get_cached_doc("Pricing Rule", scheme)
+        rows_to_check = rows
+        if not changes.header_changed:
+            rows_to_check = [row for row in rows if row.name in changes.rows]
 
-        prule = frappe.get_doc("Pricing Rule", row.pricing_scheme)
-        territories = get_child("Territory", prule.territory)
-        if prule.territory and doc.territory not in territories:
+        recheck_totals = prule.mixed_conditions and changes.items_changed
+        if not (rows_to_check or recheck_totals or prule.condition):
+            continue
+
+        row = (rows_to_check or rows)[0]
+        if prule.territory and not is_descendant_of(
+            "Territory", doc.territory, prule.territory
+        ):
             frappe.throw(
                 _("Row #{2}: Pricing Rule {0}({1}) is not applicable.").format(
                     prule.name, prule.title, row.idx
                 )
             )
 
-        customer_groups = get_child("Customer Group", prule.customer_group)
-        if prule.customer_group and doc.customer_group not in customer_groups:
+        if prule.customer_group and not is_descendant_of(
+            "Customer Group", doc.customer_group, prule.customer_group
+        ):
             frappe.throw(
                 _("Row #{2}: Pricing Rule {0}({1}) is not applicable.").format(
                     prule.name, prule.title, row.idx
@@ -185,25 +351,40 @@ def validate_applied_scheme(doc, method=None):
                 )
             )
 
-        sqty = row.stock_qty
-        if prule.qty_based_on != "Stock":
-            sqty = row.total_weight
-
-        amount = row.net_amount
         if prule.mixed_conditions:
+            if not (rows_to_check or recheck_totals):
+                continue
+
             sqty, amount = get_qty_and_rate_for_mixed_conditions(
                 doc, prule, {"validate_for": prule.name}
             )
+            if not filter_pricing_rules_for_qty_amount(sqty, amount, prule):
+                frappe.throw(
+                    _("Row #{2}: Pricing Rule {0}({1}) is not applicable.").format(
+                        prule.name, prule.title, row.idx
+                    )
+                )
+            continue
 
-        if not filter_pricing_rules_for_qty_amount(sqty, amount, prule):
-            frappe.throw(
-                _("Row #{2}: Pricing Rule {0}({1}) is not applicable.").format(
-                    prule.name, prule.title, row.idx
+        qtys = [
+            row.stock_qty if prule.qty_based_on == "Stock" else row.total_weight
+            for row in rows_to_check
+        ]
+        amounts = [row.net_amount for row in rows_to_check]
+        for row, applicable in zip(
+            rows_to_check,
+            get_slab_mask([prule] * len(rows_to_check), qtys, amounts),
+            strict=True,
+        ):
+            if not applicable:
+                frappe.throw(
+                    _("Row #{2}: Pricing Rule {0}({1}) is not applicable.").format(
+                        prule.name, prule.title, row.idx
+                    )
                 )
-            )
 
     if doc.get("pricing_scheme"):
-        prule = frappe.get_doc("Pricing Rule", doc.pricing_scheme)
+        prule = frappe.get_cached_doc("Pricing Rule", doc.pricing_scheme)
         if not filter_pricing_rule_based_on_condition([prule], doc):
             frappe.throw(
                 _(
@@ -220,23 +401,85 @@ def validate_applied_scheme(doc, method=None):
             )
 
 
-def get_child(doctype, parent):
-    p_d = frappe.db.get_list(
-        doctype,
-        filters={"name": parent},
-        fields=["lft", "rgt"],
+def validate_scheme_conditions(doc):
+    """Check the conditions of the applied schemes, which can read any order field."""
+    scheme_rows = {}
+    for row in doc.items:
+        if row.get("pricing_scheme") and not row.is_free_item:
+            scheme_rows.setdefault(row.pricing_scheme, row)
+
+    for scheme, row in scheme_rows.items():
+        prule = frappe.get_cached_doc("Pricing Rule", scheme)
+        if prule.condition and not filter_pricing_rule_based_on_condition([prule], doc):
+            frappe.throw(
+                _("Row #{2}: Pricing Rule {0}({1}) is not applicable.").format(
+                    prule.name, prule.title, row.idx
+                )
+            )
+
+    if doc.get("pricing_scheme"):
+        prule = frappe.get_cached_doc("Pricing Rule", doc.pricing_scheme)
+        if prule.condition and not filter_pricing_rule_based_on_condition([prule], doc):
+            frappe.throw(
+                _(
+                    "Pricing Rule {0}({1}) is not applicable for the transaction."
+                ).format(prule.name, prule.title)
+            )
+
+
+def get_scheme_changes(doc):
+    """Return the header and row changes of `doc` that schemes depend on."""
+    doc_before_save = doc.get_doc_before_save()
+    if not doc_before_save or any(
+        doc.has_value_changed(field) for field in scheme_header_fields
+    ):
+        return frappe._dict(header_changed=True, rows=set(), items_changed=True)
+
+    old_rows = {row.name: row for row in doc_before_save.get("items")}
+    changed_rows = {
+        row.name
+        for row in doc.items
+        if row.name not in old_rows
+        or any(
+            row.get(field) != old_rows[row.name].get(field)
+            for field in scheme_row_fields
+        )
+    }
+
+    return frappe._dict(
+        header_changed=False,
+        rows=changed_rows,
+        items_changed=bool(changed_rows) or len(old_rows) != len(doc.items),
     )
-    if not p_d:
-        return []
 
-    p_d = p_d[0]
-    if p_d.rgt - p_d.lft <= 1:
-        parent = [parent]
-    else:
-        parent = [parent] + frappe.get_list(
-            doctype,
-            {"lft": [">", p_d.lft], "rgt": ["<", p_d.rgt]},
-            pluck="name",
+
+def get_pricing_fingerprint(doc):
+    """Return a hash of everything the schemes applied on `doc` depend on."""
+    values = [get_rule_index_version(), cstr(doc.get("pricing_scheme"))]
+    values += [
+        cstr(doc.get(field)) for field in scheme_header_fields + scheme_discount_fields
+    ]
+    for row in doc.items:
+        values.append(
+            [
+                cstr(row.item_code),
+                cstr(row.uom),
+                *[flt(row.get(field), 6) for field in scheme_locked_fields],
+                cstr(row.get("pricing_scheme")),
+                cint(row.is_free_item),
+                cint(row.get("skip_auto_apply_scheme")),
+            ]
         )
 
-    return parent
+    return hashlib.md5(json.dumps(values, default=str).encode()).hexdigest()
+
+
+def is_pricing_unchanged(doc):
+    """Return True if the fingerprint saved with the order still matches `doc`."""
+    doc_before_save = doc.get_doc_before_save()
+    stored = doc_before_save and doc_before_save.get("pricing_fingerprint")
+    return bool(stored) and stored == get_pricing_fingerprint(doc)
+
+
+def get_child(doctype, parent):
+    return get_descendants(doctype, parent)
@@ -0,0 +1,117 @@
+# Copyright (c) 2024, Wahni IT Solutions Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+"""Opt-in per stage profiling of scheme evaluation.
+
+Set `pricing_scheme_debug` in site config to profile every evaluation and
+return the numbers in the `_debug` section of the `get_pricing_rules`
+response. Set `pricing_scheme_slow_log_sample_rate` (0 to 1) to profile a
+sample of evaluations and log those slower than
+`pricing_scheme_slow_log_threshold_ms` (1000 by default) to the
+`pricing_scheme_slow` log.
+"""
+
+import random
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, flt
+
+SLOW_LOG_THRESHOLD_MS = 1000
+
+
+def start_profile(context):
+    """Attach a profile to the evaluation `context` if this evaluation is profiled."""
+    debug = cint(frappe.conf.get("pricing_scheme_debug"))
+    sample_rate = flt(frappe.conf.get("pricing_scheme_slow_log_sample_rate"))
+    if not debug and not (sample_rate and random.random() < sample_rate):
+        context.profile = None
+        return
+
+    profile = frappe._dict(
+        debug=debug,
+        start=time.perf_counter(),
+        queries=0,
+        sql=frappe.db.sql,
+        stages={},
+        rules={},
+    )
+
+    def counting_sql(*args, **kwargs):
+        profile.queries += 1
+        return profile.sql(*args, **kwargs)
+
+    frappe.db.sql = counting_sql
+    context.profile = profile
+
+
+def stop_profile(context):
+    """Detach the profile of `context`, if any, restoring `frappe.db.sql`."""
+    profile = context.get("profile")
+    if profile:
+        context.profile = None
+        frappe.db.sql = profile.sql
+
+    return profile
+
+
+def finish_profile(context, lines):
+    """Detach the profile of `context` and return its summary, logging slow evaluations."""
+    profile = stop_profile(context)
+    if not profile:
+        return
+
+    for samples in [profile.stages, *profile.rules.values()]:
+        for sample in samples.values():
+            sample["ms"] = flt(sample["ms"], 3)
+
+    summary = {
+        "total_ms": flt((time.perf_counter() - profile.start) * 1000, 3),
+        "queries": profile.queries,
+        "lines": lines,
+        "stages": profile.stages,
+        "rules": profile.rules,
+    }
+
+    threshold = flt(frappe.conf.get("pricing_scheme_slow_log_threshold_ms"))
+    if summary["total_ms"] >= (threshold or SLOW_LOG_THRESHOLD_MS):
+        frappe.logger("pricing_scheme_slow", allow_site=True).info(
+            {
+                "doctype": context.doc.doctype,
+                "name": context.doc.name,
+                "user": frappe.session.user,
+                **summary,
+            }
+        )
+
+    if profile.debug:
+        return summary
+
+
+@contextmanager
+def profile_stage(context, stage, rule=None):
+    """Record the time and queries of the block under `stage`, and `rule` if given."""
+    profile = context.get("profile") if context else None
+    if not profile:
+        yield {}
+        return
+
+    result = {}
+    start, queries = time.perf_counter(), profile.queries
+    try:
+        yield result
+    finally:
+        elapsed, sql = time.perf_counter() - start, profile.queries - queries
+        add_sample(profile.stages, stage, elapsed, sql, result.get("rows"))
+        if rule:
+            add_sample(profile.rules.setdefault(rule, {}), stage, elapsed, sql)
+
+
+def add_sample(stages, stage, elapsed, queries, rows=None):
+    sample = stages.setdefault(stage, {"ms": 0, "calls": 0, "queries": 0})
+    sample["ms"] += elapsed * 1000
+    sample["calls"] += 1
+    sample["queries"] += queries
+    if rows is not None:
+        sample["rows"] = sample.get("rows", 0) + rows
@@ -0,0 +1,468 @@
+# Copyright (c) 2024, Wahni IT Solutions Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from bisect import bisect_left, bisect_right
+
+import frappe
+from frappe.utils import cstr, flt, getdate
+
+from pricing_scheme.utils.nested_set import get_ancestors
+
+RULE_INDEX_KEY = "pricing_scheme:rule_index"
+RULE_INDEX_VERSION_KEY = "pricing_scheme:rule_index_version"
+TRANSACTION_RULES_KEY = "pricing_scheme:transaction_rules"
+TRANSACTION_RULES_TTL = 24 * 60 * 60
+
+rule_child_tables = {
+    "Item Code": ("Pricing Rule Item Code", "item_code"),
+    "Item Group": ("Pricing Rule Item Group", "item_group"),
+    "Brand": ("Pricing Rule Brand", "brand"),
+}
+
+# Pricing Rule fields the engine reads: applicability, slabs, conditions,
+# priority and the rule details sent to the client
+rule_record_fields = (
+    "name",
+    "modified",
+    "title",
+    "apply_on",
+    "apply_rule_on_other",
+    "other_item_code",
+    "other_item_group",
+    "other_brand",
+    "selling",
+    "buying",
+    "company",
+    "customer",
+    "customer_group",
+    "territory",
+    "supplier",
+    "supplier_group",
+    "campaign",
+    "sales_partner",
+    "warehouse",
+    "for_price_list",
+    "valid_from",
+    "valid_upto",
+    "currency",
+    "priority",
+    "condition",
+    "mixed_conditions",
+    "min_qty",
+    "max_qty",
+    "min_amt",
+    "max_amt",
+    "qty_based_on",
+    "price_or_product_discount",
+    "rate_or_discount",
+    "margin_type",
+    "rate",
+    "discount_percentage",
+    "discount_amount",
+    "apply_discount_on",
+    "rate_based_on",
+    "free_qty",
+    "free_qty_type",
+    "free_item_uom",
+    "is_recursive",
+    "recurse_for",
+    "apply_recursion_over",
+    "round_free_qty",
+    "auto_apply_scheme",
+    "allow_skipping",
+    "has_multiple_free_items",
+    "has_item_wise_rates",
+    "has_item_group_wise_discounts",
+    "has_item_wise_discounts",
+)
+
+
+class RuleRecord:
+    """Slotted Pricing Rule row holding only `rule_record_fields`."""
+
+    __slots__ = rule_record_fields
+
+    def __init__(self, row):
+        for field in rule_record_fields:
+            setattr(self, field, row.get(field))
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def as_dict(self):
+        return frappe._dict({field: getattr(self, field) for field in rule_record_fields})
+
+
+class RuleMatch:
+    """A `RuleRecord` matched on one line, with the matched apply on value and uom."""
+
+    __slots__ = ("rule", "item_code", "item_group", "brand", "uom", "priority")
+
+    def __init__(self, rule, field, value, uom):
+        self.rule = rule
+        self.item_code = self.item_group = self.brand = None
+        setattr(self, field, value)
+        self.uom = uom
+        self.priority = rule.priority
+
+    def __getattr__(self, key):
+        if key == "rule":
+            raise AttributeError(key)
+
+        return getattr(self.rule, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def as_dict(self):
+        return frappe._dict(
+            self.rule.as_dict(),
+            item_code=self.item_code,
+            item_group=self.item_group,
+            brand=self.brand,
+            uom=self.uom,
+            priority=self.priority,
+        )
+
+
+def get_rule_records(filters):
+    """Return the Pricing Rules matching `filters` as `RuleRecord`s."""
+    meta = frappe.get_meta("Pricing Rule")
+    fields = [
+        field
+        for field in rule_record_fields
+        if field in ("name", "modified") or meta.has_field(field)
+    ]
+    return [
+        RuleRecord(row)
+        for row in frappe.get_all("Pricing Rule", filters=filters, fields=fields)
+    ]
+
+
+transaction_rule_filters = [
+    "company",
+    "customer",
+    "supplier",
+    "campaign",
+    "sales_partner",
+    "customer_group",
+    "territory",
+    "supplier_group",
+    "transaction_date",
+]
+
+selling_doctypes = (
+    "Quotation",
+    "Sales Order",
+    "Delivery Note",
+    "Sales Invoice",
+    "POS Invoice",
+)
+
+
+def get_rule_index():
+    return frappe.cache.get_value(RULE_INDEX_KEY, generator=build_rule_index)
+
+
+def get_rule_index_version():
+    """Return the version of the rule index without loading the index itself."""
+    return frappe.cache.get_value(RULE_INDEX_VERSION_KEY) or get_rule_index().version
+
+
+def clear_rule_index(doc=None, method=None, *args):
+    frappe.cache.delete_value(RULE_INDEX_KEY)
+    frappe.cache.delete_value(RULE_INDEX_VERSION_KEY)
+    clear_transaction_rules()
+
+
+def clear_transaction_rules(doc=None, method=None, *args):
+    frappe.cache.delete_value(TRANSACTION_RULES_KEY)
+
+
+def get_transaction_rules(doc):
+    """Return the enabled Transaction rules that can apply to `doc`, cached per version."""
+    args = frappe._dict({field: doc.get(field) for field in transaction_rule_filters})
+    transaction_type = "selling" if doc.get("doctype") in selling_doctypes else "buying"
+    version = frappe.cache.get_value(
+        TRANSACTION_RULES_KEY, generator=lambda: frappe.generate_hash(length=10)
+    )
+
+    key = "{}:{}:{}".format(
+        TRANSACTION_RULES_KEY,
+        version,
+        "|".join(
+            [transaction_type]
+            + [cstr(args[field]) for field in transaction_rule_filters]
+        ),
+    )
+    rules = frappe.cache.get_value(key)
+    if rules is None:
+        rules = [
+            rule
+            for rule in get_all_transaction_rules(version)
+            if rule.get(transaction_type) and is_rule_valid_for(rule, args)
+        ]
+        frappe.cache.set_value(key, rules, expires_in_sec=TRANSACTION_RULES_TTL)
+
+    return rules
+
+
+def get_all_transaction_rules(version):
+    key = f"{TRANSACTION_RULES_KEY}:{version}"
+    rules = frappe.cache.get_value(key)
+    if rules is None:
+        rules = get_rule_records({"apply_on": "Transaction", "disable": 0})
+        frappe.cache.set_value(key, rules, expires_in_sec=TRANSACTION_RULES_TTL)
+
+    return rules
+
+
+def build_rule_index():
+    """Compile the enabled item level Pricing Rules into lookup tables."""
+    rules = {
+        d.name: d
+        for d in get_rule_records(
+            {"disable": 0, "apply_on": ["in", list(rule_child_tables)]}
+        )
+    }
+    index = frappe._dict(
+        {
+            "rules": rules,
+            "selling": {},
+            "buying": {},
+            "slabs": {name: get_slab_bounds(rule) for name, rule in rules.items()},
+            "tiers": {"selling": {}, "buying": {}},
+            "rule_items": {name: [] for name in rules},
+            "version": frappe.generate_hash(length=10),
+        }
+    )
+    frappe.cache.set_value(RULE_INDEX_VERSION_KEY, index.version)
+    if not rules:
+        return index
+
+    for child_doctype, field in rule_child_tables.values():
+        seen_other = set()
+        for row in frappe.get_all(
+            child_doctype,
+            filters={"parenttype": "Pricing Rule", "parent": ["in", list(rules)]},
+            fields=["parent", field, "uom"],
+        ):
+            rule = rules[row.parent]
+            entry = (rule.name, row.get(field), row.uom)
+            if rule_child_tables.get(rule.apply_on) == (child_doctype, field):
+                index.rule_items[rule.name].append(row.get(field))
+
+            for transaction_type in ("selling", "buying"):
+                if not rule.get(transaction_type):
+                    continue
+
+                tables = index[transaction_type]
+                tables.setdefault(field, {}).setdefault(row.get(field), []).append(entry)
+
+                other_value = rule.get("other_" + field)
+                if rule.apply_rule_on_other and other_value:
+                    if (transaction_type, rule.name) in seen_other:
+                        continue
+                    seen_other.add((transaction_type, rule.name))
+                    tables.setdefault("other_" + field, {}).setdefault(other_value, []).append(
+                        (rule.name, row.get(field), None)
+                    )
+
+    for transaction_type in ("selling", "buying"):
+        index.tiers[transaction_type] = build_tiers(index, transaction_type)
+
+    return index
+
+
+def build_tiers(index, transaction_type):
+    """Index the entries of every apply on value by their qty slab."""
+    tiers = {}
+    for field, values in index[transaction_type].items():
+        for value, entries in values.items():
+            tier = {"untiered": []}
+            for entry in entries:
+                rule = index.rules[entry[0]]
+                if rule.mixed_conditions:
+                    tier["untiered"].append(entry)
+                else:
+                    tier.setdefault(rule.qty_based_on == "Weight", []).append(
+                        (index.slabs[rule.name], entry)
+                    )
+
+            for by_weight in (True, False):
+                if by_weight in tier:
+                    tier[by_weight] = compile_tiers(tier[by_weight])
+
+            tiers[(field, value)] = tier
+
+    return tiers
+
+
+def compile_tiers(slabs):
+    slabs = sorted(slabs, key=lambda d: d[0][0])
+    mins, max_so_far, upper = [], [], float("-inf")
+    for (min_qty, max_qty, _, _), _ in slabs:
+        upper = max(upper, max_qty)
+        mins.append(min_qty)
+        max_so_far.append(upper)
+
+    return mins, max_so_far, slabs
+
+
+def get_tier_entries(tier, args):
+    """Return the entries of `tier` that can apply to the line in `args`."""
+    amount = flt(args.get("net_amount"))
+    entries = list(tier["untiered"])
+    for by_weight in (True, False):
+        if by_weight not in tier:
+            continue
+
+        qty = flt(args.get("total_weight") if by_weight else args.get("stock_qty"))
+        mins, max_so_far, slabs = tier[by_weight]
+        end = bisect_right(mins, qty)
+        start = bisect_left(max_so_far, qty, 0, end)
+        entries.extend(
+            entry
+            for (_, max_qty, min_amt, max_amt), entry in slabs[start:end]
+            if qty <= max_qty and min_amt <= amount <= max_amt
+        )
+
+    return entries
+
+
+def get_slab_bounds(rule):
+    """Return the rule's `(min_qty, max_qty, min_amt, max_amt)`, an unset maximum being unbounded."""
+    return (
+        flt(rule.min_qty),
+        flt(rule.max_qty) or float("inf"),
+        flt(rule.min_amt),
+        flt(rule.max_amt) or float("inf"),
+    )
+
+
+def has_pricing_rules(transaction_type):
+    return bool(get_rule_index().get(transaction_type))
+
+
+def get_auto_apply_rules(args):
+    """Return the names of the auto apply Price rules that can apply to the transaction in `args`."""
+    transaction_type = args.get("transaction_type") or (
+        "selling" if args.get("doctype") in selling_doctypes else "buying"
+    )
+    return {
+        name
+        for name, rule in get_rule_index().rules.items()
+        if rule.auto_apply_scheme
+        and rule.price_or_product_discount == "Price"
+        and rule.get(transaction_type)
+        and is_rule_applicable(rule, args)
+    }
+
+
+def get_candidate_rules(args):
+    """Return the item level Pricing Rules matching `args`, as `_get_pricing_rules` does."""
+    index = get_rule_index()
+    tables = index.get(args.transaction_type) or {}
+    tiers = index.tiers.get(args.transaction_type)
+    pricing_rules = []
+
+    for field in ("item_code", "item_group", "brand"):
+        if not args.get(field):
+            continue
+
+        matched = {}
+        for name, value, uom in get_index_entries(tables, field, args, tiers):
+            if name in matched:
+                continue
+
+            rule = index.rules[name]
+            if not is_rule_applicable(rule, args):
+                continue
+
+            matched[name] = RuleMatch(rule, field, value, uom)
+
+        pricing_rules.extend(
+            sorted(
+                matched.values(),
+                key=lambda d: (cstr(d.priority), d.name),
+                reverse=True,
+            )
+        )
+
+    return pricing_rules
+
+
+def get_index_entries(tables, field, args, tiers=None):
+    values = [args.get(field)]
+    if field == "item_group":
+        values = get_ancestors("Item Group", args.item_group)
+
+    for value in values:
+        for entry in get_entries(tables, tiers, field, value, args):
+            if field == "brand" or not args.get("uom") or entry[2] in (args.uom, None, ""):
+                yield entry
+
+    if field == "item_code":
+        if "variant_of" not in args:
+            args.variant_of = frappe.get_cached_value("Item", args.item_code, "variant_of")
+
+        if args.variant_of:
+            yield from get_entries(tables, tiers, field, args.variant_of, args)
+
+    yield from get_entries(tables, tiers, "other_" + field, args.get(field), args)
+
+
+def get_entries(tables, tiers, field, value, args):
+    """Return the entries of `value`, narrowed to the line's qty tiers when it has a qty."""
+    if tiers is None or args.get("stock_qty") is None:
+        return tables.get(field, {}).get(value, [])
+
+    tier = tiers.get((field, value))
+    return get_tier_entries(tier, args) if tier else []
+
+
+def is_rule_applicable(rule, args):
+    if not is_rule_valid_for(rule, args):
+        return False
+
+    if rule.for_price_list and rule.for_price_list != args.get("price_list"):
+        return False
+
+    return True
+
+
+def is_rule_valid_for(rule, args):
+    """Check the rule's party, group, territory and validity against `args`."""
+    for field in ("company", "customer", "supplier", "campaign", "sales_partner"):
+        if rule.get(field) and rule.get(field) != args.get(field):
+            return False
+
+    for doctype in ("Customer Group", "Territory", "Supplier Group", "Warehouse"):
+        field = frappe.scrub(doctype)
+        if (
+            rule.get(field)
+            and args.get(field)
+            and rule.get(field) not in get_ancestors(doctype, args.get(field))
+        ):
+            return False
+
+    if args.get("transaction_date"):
+        transaction_date = getdate(args.transaction_date)
+        if rule.valid_from and getdate(rule.valid_from) > transaction_date:
+            return False
+        if rule.valid_upto and getdate(rule.valid_upto) < transaction_date:
+            return False
+
+    return True
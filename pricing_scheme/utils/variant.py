@@ -4,10 +4,25 @@
 import frappe
 from erpnext.controllers.item_variant import create_variant, get_variant
 
+DOOR_ATTRIBUTES_KEY = "pricing_scheme:door_attributes"
+
 
 @frappe.whitelist()
 def get_door_attributes():
+	return frappe.cache.get_value(DOOR_ATTRIBUTES_KEY, generator=build_door_attributes)
+
+
+def build_door_attributes():
 	attributes = frappe.db.get_all("Item Attribute", pluck='attribute_name')
+	attribute_values = frappe.db.get_all("Item Attribute Value", filters={
+		"parenttype": "Item Attribute",
+		"parent": ["in", attributes]
+	}, fields=["parent", "attribute_value"], order_by="attribute_value asc") if attributes else []
+
+	values = {}
+	for d in attribute_values:
+		values.setdefault(d.parent, []).append(d.attribute_value)
+
 	attribute = []
 	idx = int(len(attributes) / 2)
 	for attr in attributes:
@@ -16,7 +31,7 @@ def get_door_attributes():
 			"label": attr,
 			"fieldname": attribute_name,
 			"fieldtype": 'Select',
-			"options": frappe.db.get_all("Item Attribute Value", {"parent": attr}, pluck="attribute_value", order_by="attribute_value asc"),
+			"options": values.get(attr, []),
 			"reqd": 0,
 			"hidden": 1,
 			"default": ""
@@ -31,6 +46,10 @@ def get_door_attributes():
 	return attribute
 
 
+def clear_door_attributes(doc=None, method=None, *args):
+	frappe.cache.delete_value(DOOR_ATTRIBUTES_KEY)
+
+
 @frappe.whitelist()
 def get_door_variant(model, attributes):
 	item = get_variant(model, args=attributes)